@@ -1,9 +1,12 @@
 import asyncio
+import logging
 import os
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from dotenv import find_dotenv, load_dotenv
 
 from filters.chat_types import ChatTypeFilter, UserInGroupAndChannelFilter
@@ -11,31 +14,141 @@ from handlers.admin_private import admin_router
 
 load_dotenv(find_dotenv())
 
-from middleware.database_middlewares import DataBaseSession
+from middleware.database_middlewares import DataBaseSession, QueryBudget
+from middleware.throttling_middlewares import CallbackThrottling, get_token_bucket
 
-from database.database_engine import create_db, session_maker
+from database.cache import cache_stats
+from database.database_engine import create_db, engine, session_maker
+from database.instrumentation import instrument_engine
+from database.metrics import pool_metrics
+from database.fsm_storage import get_fsm_storage
+from excel.excel_functional import order_exporter
 
-from handlers.user_private import user_private_router
+from handlers.menu_processing import build_menu_snapshots, screen_timings
+from handlers.user_private import is_navigation_click, is_quantity_click, user_private_router
+from telegram_api.media import media_storage
+from telegram_api.scheduled_session import ScheduledSession
 
-bot = Bot(token=os.getenv('TELEGRAM_TOKEN'), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+bot = Bot(
+    token=os.getenv('TELEGRAM_TOKEN'),
+    session=ScheduledSession(global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', 30)),
+                             chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', 1)),
+                             edit_rate=float(os.getenv('TELEGRAM_EDIT_RATE', 5))),
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+)
 
-dp = Dispatcher()
+dp = Dispatcher(storage=get_fsm_storage(session_maker))
 
 dp.include_router(user_private_router)
 dp.include_router(admin_router)
 user_private_router.message.filter(ChatTypeFilter(["private"]), UserInGroupAndChannelFilter(bot))
 
+db_session_middleware = DataBaseSession(session_pool=session_maker)
+throttling_middleware = CallbackThrottling(
+    get_token_bucket(),
+    keep_all=is_quantity_click,
+    keep_all_bucket=get_token_bucket('THROTTLE_QUANTITY', rate=20, burst=30),  # +1/-1 склеиваются, лимит щедрее
+    supersede=is_navigation_click,  # Корзину и заказ не отбрасываем, только переходы по меню
+)
 
-async def on_startup(bot):
-    await create_db()
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling или webhook
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес, например https://example.com/webhook
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+METRICS_PORT = os.getenv('METRICS_PORT')  # В режиме polling поднимаем /health и /metrics, только если задан порт
 
 
-async def main():
+async def on_startup(bot):
+    await create_db()
+    async with session_maker() as session:
+        await media_storage.prewarm(bot, session)  # Снимки меню строим уже с file_id баннеров
+        await build_menu_snapshots(session)
+
+
+async def set_webhook(bot):
+    """Регистрируем вебхук в Telegram (если не задан WEBHOOK_URL, сервер принимает апдейты только локально)"""
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True,
+        )
+
+
+async def health(request: web.Request):
+    """Эндпоинт проверки работоспособности"""
+    return web.json_response({'status': 'ok'})
+
+
+async def metrics(request: web.Request):
+    """Эндпоинт метрик пула соединений и кэшей"""
+    return web.json_response({
+        'pool': pool_metrics.stats(engine.sync_engine.pool),
+        'sessions': db_session_middleware.stats(),
+        'throttling': throttling_middleware.stats(),
+        'telegram_api': bot.session.stats(),
+        'cache': cache_stats(),
+        'media': media_storage.stats(),
+        'screens': screen_timings.stats(),
+        'order_export': order_exporter.stats(),
+    })
+
+
+def add_monitoring_routes(app: web.Application):
+    """Добавляем эндпоинты мониторинга в aiohttp приложение"""
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics)
+
+
+def run_webhook():
+    """Запускаем бота в режиме вебхука на aiohttp сервере"""
+    dp.startup.register(set_webhook)
+
+    app = web.Application()
+    add_monitoring_routes(app)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)  # Запуск startup/shutdown хуков диспетчера и закрытие сессии бота
+
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+
+async def run_polling():
+    """Запускаем бота в режиме long polling"""
+    runner = None
+    if METRICS_PORT:
+        app = web.Application()
+        add_monitoring_routes(app)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, int(METRICS_PORT)).start()
+
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
+def main():
     dp.startup.register(on_startup)
-
-    dp.update.middleware(DataBaseSession(session_pool=session_maker))
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-
-
-asyncio.run(main())
+    dp.startup.register(order_exporter.start)
+    dp.shutdown.register(order_exporter.stop)
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+    instrument_engine(engine)
+    dp.update.outer_middleware(QueryBudget(budget=int(os.getenv('QUERY_BUDGET', 10)),
+                                           strict=os.getenv('QUERY_BUDGET_STRICT', 'false').lower() in ('1', 'true')))
+    dp.callback_query.outer_middleware(throttling_middleware)
+    db_session_middleware.setup(user_private_router)
+    db_session_middleware.setup(admin_router)
+    if BOT_MODE == 'webhook':
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
+
+
+main()
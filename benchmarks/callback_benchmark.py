@@ -0,0 +1,53 @@
+"""Бенчмарк колбеков меню: старый текстовый формат "menu:..." против компактного, время pack/unpack и размер.
+
+Запуск: python -m benchmarks.callback_benchmark
+"""
+import time
+
+from aiogram.filters.callback_data import CallbackData
+
+from buttons.inline_buttons import MenuCallBack, _decode_compact
+
+ITERATIONS = 20_000
+CALLBACKS = [
+    (MenuCallBack(level=0, menu_name='main'), 'main'),
+    (MenuCallBack(level=2, menu_name='category', category=3), 'Компьютерные комплектующие'),
+    (MenuCallBack(level=3, menu_name='next', category=17, page=12), 'next'),
+    (MenuCallBack(level=4, menu_name='increment', product_id=1534, page=7), 'increment'),
+    (MenuCallBack(level=4, menu_name='add_to_cart', product_id=1534, quantity=7, page=7), 'add_to_cart'),
+]  # (колбек, menu_name в старом формате - у категорий там было название)
+
+
+def measure(function, values) -> float:
+    """Среднее время одного вызова в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS // len(values)):
+        for value in values:
+            function(value)
+    return (time.perf_counter() - start) / (ITERATIONS // len(values) * len(values)) * 1_000_000
+
+
+def unpack_uncached(value: str) -> MenuCallBack:
+    """Распаковка при каждом вызове с пустым кэшем разбора (первое нажатие кнопки)"""
+    _decode_compact.cache_clear()
+    return MenuCallBack.unpack(value)
+
+
+def main():
+    legacy = [callback.model_copy(update={'menu_name': name}) for callback, name in CALLBACKS]
+    compact = [callback for callback, _ in CALLBACKS]
+    legacy_packed = [CallbackData.pack(callback) for callback in legacy]
+    compact_packed = [callback.pack() for callback in compact]
+
+    print(f"{'колбек':<44}{'старый, байт':>14}{'новый, байт':>14}")
+    for (callback, name), old, new in zip(CALLBACKS, legacy_packed, compact_packed):
+        print(f"{callback.menu_name + ' ' + name:<44}{len(old.encode()):>14}{len(new.encode()):>14}")
+
+    print(f"pack:   старый {measure(CallbackData.pack, legacy):.2f} мкс, новый {measure(MenuCallBack.pack, compact):.2f} мкс")
+    print(f"unpack: старый {measure(MenuCallBack.unpack, legacy_packed):.2f} мкс, "
+          f"новый {measure(MenuCallBack.unpack, compact_packed):.2f} мкс, "
+          f"новый без кэша разбора {measure(unpack_uncached, compact_packed):.2f} мкс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Микробенчмарк построения inline-клавиатур: без кэша и с кэшем.
+
+Запуск: python -m benchmarks.keyboards_benchmark
+"""
+import random
+import time
+from types import SimpleNamespace
+
+from buttons import inline_buttons
+
+CATEGORIES = [SimpleNamespace(id=i, name=f'Категория {i}') for i in range(1, 7)]
+ITERATIONS = 20_000
+
+
+def navigation_step(rnd: random.Random, cached: bool):
+    """Один синтетический колбек навигации по меню"""
+    step = rnd.randrange(4)
+    page = rnd.randint(1, 20)
+    pagination = {"◀ Пред.": "previous", "След. ▶": "next"}
+    if cached:
+        if step == 0:
+            return inline_buttons.get_user_main_buttons(level=0)
+        if step == 1:
+            return inline_buttons.get_user_catalog_buttons(level=1, categories=CATEGORIES)
+        if step == 2:
+            return inline_buttons.get_products_buttons(level=3, category=1, page=page,
+                                                       pagination_buttons=pagination, product_id=page)
+        return inline_buttons.get_user_precart(level=4, page=page, product_id=1)
+
+    if step == 0:
+        return inline_buttons.get_user_main_buttons.__wrapped__(level=0)
+    if step == 1:
+        return inline_buttons._get_user_catalog_buttons.__wrapped__(
+            1, tuple((c.id, c.name) for c in CATEGORIES), (2,))
+    if step == 2:
+        return inline_buttons._get_products_buttons.__wrapped__(3, 1, page, tuple(pagination.items()), page, (2, 1))
+    return inline_buttons.get_user_precart.__wrapped__(level=4, page=page, product_id=1)
+
+
+def run(cached: bool) -> float:
+    """Возвращаем количество колбеков в секунду"""
+    rnd = random.Random(42)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        navigation_step(rnd, cached)
+    return ITERATIONS / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    before = run(cached=False)
+    after = run(cached=True)
+    print(f'Без кэша: {before:,.0f} колбеков/с')
+    print(f'С кэшем:  {after:,.0f} колбеков/с (x{after / before:.1f})')
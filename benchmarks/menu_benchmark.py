@@ -0,0 +1,61 @@
+"""Бенчмарк рендера статичных экранов меню: построение с запросами в БД и выдача готовых снимков.
+
+Запуск: python -m benchmarks.menu_benchmark (нужен aiosqlite)
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ['DATABASE_ENGINE'] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'menu.sqlite3')}"
+
+from sqlalchemy import insert, update  # noqa: E402
+
+from database.cache import banner_cache, catalog_cache  # noqa: E402
+from database.database_engine import create_db, engine, session_maker  # noqa: E402
+from database.models import Banner, Question  # noqa: E402
+from handlers.menu_processing import build_menu_snapshots, get_menu_content, get_static_content  # noqa: E402
+
+RENDERS = 2000
+SCREENS = [(0, 'main', None, 1), (1, 'catalog', None, 1), (2, 'ПК', 1, 1), (2, 'Гаджеты', 2, 1), (6, 'faq', None, 1),
+           (6, 'next', None, 2)]
+
+
+async def prepare():
+    await create_db()
+    async with session_maker() as session:
+        await session.execute(update(Banner).values(image='benchmark-file-id'))
+        await session.execute(insert(Question), [{'question': f'Вопрос {i}', 'answer': f'Ответ {i}'} for i in range(5)])
+        await session.commit()
+
+
+async def run(snapshots: bool) -> float:
+    """Возвращаем количество рендеров в секунду"""
+    rnd = random.Random(42)
+    async with session_maker() as session:
+        if snapshots:
+            await build_menu_snapshots(session)
+        start = time.perf_counter()
+        for _ in range(RENDERS):
+            level, menu_name, category, page = rnd.choice(SCREENS)
+            if snapshots:
+                await get_menu_content(session, level=level, menu_name=menu_name, category=category, page=page)
+            else:
+                banner_cache.invalidate()
+                catalog_cache.invalidate()
+                await get_static_content(session, level, menu_name, category, page)
+        return RENDERS / (time.perf_counter() - start)
+
+
+async def main():
+    await prepare()
+    before = await run(snapshots=False)
+    after = await run(snapshots=True)
+    await engine.dispose()
+    print(f'Без снимков: {before:,.0f} рендеров/с')
+    print(f'Со снимками: {after:,.0f} рендеров/с (x{after / before:.1f})')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
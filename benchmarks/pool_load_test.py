@@ -0,0 +1,48 @@
+"""Нагрузочный тест пула соединений: параллельные обработчики через DataBaseSession.
+
+Запуск: DATABASE_ENGINE=postgresql+asyncpg://... python -m benchmarks.pool_load_test
+(по умолчанию используется временная SQLite база, нужен aiosqlite)
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_ENGINE', f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'pool.sqlite3')}")
+
+from sqlalchemy import text  # noqa: E402
+
+from database.database_engine import engine, session_maker  # noqa: E402
+from database.metrics import pool_metrics  # noqa: E402
+from middleware.database_middlewares import DataBaseSession  # noqa: E402
+
+CONCURRENCY = int(os.getenv('LOAD_CONCURRENCY', 50))
+REQUESTS = int(os.getenv('LOAD_REQUESTS', 1000))
+HANDLER_DELAY = float(os.getenv('LOAD_HANDLER_DELAY', 0.01))  # Время, которое обработчик держит соединение
+
+
+async def handler(event, data):
+    """Имитируем обработчик, который делает запрос и держит соединение"""
+    await data['session'].execute(text('SELECT 1'))
+    await asyncio.sleep(HANDLER_DELAY)
+
+
+async def main():
+    middleware = DataBaseSession(session_pool=session_maker)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one_update():
+        async with semaphore:
+            await middleware(handler, None, {})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_update() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+
+    print(f'{REQUESTS} апдейтов, параллельно {CONCURRENCY}: {REQUESTS / elapsed:,.0f} апдейтов/с')
+    print(pool_metrics.stats(engine.sync_engine.pool))
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
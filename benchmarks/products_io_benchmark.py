@@ -0,0 +1,68 @@
+"""Бенчмарк массового импорта/экспорта товаров: строк в секунду и пиковая память (без БД).
+
+Запуск: python -m benchmarks.products_io_benchmark
+"""
+import csv
+import os
+import tempfile
+import time
+import tracemalloc
+
+from database.catalog import CatalogTree
+from database.menu_steps import categories, subcategories
+from excel.products_io import PRODUCT_COLUMNS, create_products_workbook, parse_product_row, read_product_rows
+
+ROWS = 50_000
+
+TREE = CatalogTree([(category_id, categories[category_id - 1], subcategory_id, name, 0)
+                    for subcategory_id, (category_id, name) in enumerate(subcategories, start=1)])
+
+
+def synthetic_rows():
+    for number in range(ROWS):
+        category_id, subcategory = subcategories[number % len(subcategories)]
+        yield [f'Товар {number}', f'{number % 10000}.99', categories[category_id - 1], subcategory,
+               f'file-id-{number}', number % 50]
+
+
+def measure(title, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{title}: {ROWS / elapsed:,.0f} строк/с, пик памяти {peak / 1024 / 1024:.1f} МБ')
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    xlsx_path = os.path.join(directory, 'products.xlsx')
+    csv_path = os.path.join(directory, 'products.csv')
+
+    def export_xlsx():
+        workbook, sheet = create_products_workbook()
+        for row in synthetic_rows():
+            sheet.append(row)
+        workbook.save(xlsx_path)
+
+    def export_csv():
+        with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(PRODUCT_COLUMNS)
+            writer.writerows(synthetic_rows())
+
+    def import_file(path):
+        rows = read_product_rows(path)
+        next(rows)  # Заголовок
+        for row in rows:
+            parse_product_row(row, TREE)
+
+    measure('Экспорт .xlsx (write-only)', export_xlsx)
+    export_csv()
+    measure('Импорт .xlsx (read-only) с проверкой', lambda: import_file(xlsx_path))
+    measure('Импорт .csv с проверкой', lambda: import_file(csv_path))
+
+
+if __name__ == '__main__':
+    main()
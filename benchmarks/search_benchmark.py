@@ -0,0 +1,44 @@
+"""Бенчмарк поиска по инвертированному индексу на синтетическом каталоге из 100 000 товаров.
+
+Цель по задержке: p95 поиска не больше 50 мс.
+Запуск: python -m benchmarks.search_benchmark
+"""
+import random
+import statistics
+import time
+
+from database.search import InvertedIndex
+
+PRODUCTS = 100_000
+QUERIES = 500
+WORDS = ['смартфон', 'ноутбук', 'чёрный', 'белый', 'часы', 'видеокарта', 'монитор', 'клавиатура', 'мышь',
+         'беспроводной', 'игровой', 'стиральная', 'машина', 'посудомоечная', 'процессор', 'память', 'корпус',
+         'наушники', 'зарядка', 'кабель', 'чехол', 'планшет', 'колонка', 'роутер']
+
+
+def synthetic_catalog(rnd: random.Random):
+    for product_id in range(1, PRODUCTS + 1):
+        words = rnd.sample(WORDS, 4) + [f'модель{rnd.randint(1, 5000)}']
+        yield product_id, ' '.join(words)
+
+
+def main():
+    rnd = random.Random(42)
+    start = time.perf_counter()
+    index = InvertedIndex(synthetic_catalog(rnd))
+    print(f'Индекс на {PRODUCTS:,} товаров построен за {time.perf_counter() - start:.2f} с')
+
+    latencies = []
+    for _ in range(QUERIES):
+        query = ' '.join(rnd.sample(WORDS, 2)) if rnd.random() < 0.8 else f'модель{rnd.randint(1, 5000)}'
+        start = time.perf_counter()
+        index.search(query, offset=rnd.choice([0, 10, 20]), limit=10)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    print(f'p50: {statistics.median(latencies):.1f} мс, p95: {latencies[int(len(latencies) * 0.95)]:.1f} мс, '
+          f'запросов в секунду: {QUERIES / (sum(latencies) / 1000):,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Бенчмарк времени старта: холодный (пустая БД) и тёплый запуск create_db на SQLite.
+
+Запуск: python -m benchmarks.startup_benchmark (нужен aiosqlite)
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'startup.sqlite3')
+os.environ['DATABASE_ENGINE'] = f'sqlite+aiosqlite:///{DB_PATH}'
+
+from database.database_engine import create_db, engine  # noqa: E402
+
+
+async def measure() -> float:
+    start = time.perf_counter()
+    await create_db()
+    return (time.perf_counter() - start) * 1000
+
+
+async def main():
+    cold = await measure()
+    warm = [await measure() for _ in range(20)]
+    await engine.dispose()
+    print(f'Холодный старт: {cold:.1f} мс')
+    print(f'Тёплый старт:   {sum(warm) / len(warm):.2f} мс (среднее из {len(warm)})')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,10 +1,53 @@
+import binascii
+import os
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import lru_cache
+
 from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+MENU_CALLBACK_VERSION = 1  # Версия компактного формата; кнопки старого текстового формата "menu:..." - версия 0
+COMPACT_MARKER = '~'  # Не входит в алфавит base64url, отличает компактный формат от старого
+MAX_CALLBACK_LENGTH = 64  # Ограничение Telegram на callback_data в байтах
+
+MENU_NAMES = (
+    'main', 'catalog', 'subcatalog', 'category', 'cart', 'faq', 'precart', 'next', 'previous',
+    'increment', 'decrement', 'add_to_cart', 'delete',
+)  # Коды меню - позиция в кортеже + 1 (0 - имя передано строкой); новые имена добавляем только в конец
+MENU_CODES = {name: code for code, name in enumerate(MENU_NAMES, start=1)}
+
+
+def _write_varint(out: bytearray, value: int):
+    """Дописываем целое как varint (zigzag, чтобы поддержать и отрицательные)"""
+    value = (value << 1) ^ (value >> 63)
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> tuple[int, int]:
+    """Читаем varint с позиции position, возвращаем значение и позицию после него"""
+    value = data[position]
+    if value < 0x80:  # Однобайтовые значения - почти все поля меню
+        return (value >> 1) ^ -(value & 1), position + 1
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return (value >> 1) ^ -(value & 1), position
+        shift += 7
+
 
 class MenuCallBack(CallbackData, prefix="menu"):
-    """Создаём колбек меню"""
+    """Создаём колбек меню
+
+    Упаковывается компактно: "~" + base64url от байтов [версия, уровень, код меню, маска полей, поля varint].
+    Кнопки старого формата "menu:уровень:имя:..." из уже отправленных сообщений по-прежнему распаковываются.
+    """
     level: int
     menu_name: str
     category: int | None = None
@@ -12,9 +55,76 @@ class MenuCallBack(CallbackData, prefix="menu"):
     product_id: int | None = None
     quantity: int | None = None
 
+    def pack(self) -> str:
+        """Упаковываем колбек в компактный формат текущей версии"""
+        fields = (self.category, None if self.page == 1 else self.page, self.product_id, self.quantity)
+        code = MENU_CODES.get(self.menu_name, 0)
+
+        data = bytearray((MENU_CALLBACK_VERSION,))
+        _write_varint(data, self.level)
+        _write_varint(data, code)
+        data.append(sum(1 << bit for bit, value in enumerate(fields) if value is not None))
+        if not code:
+            name = self.menu_name.encode()
+            _write_varint(data, len(name))
+            data += name
+        for value in fields:
+            if value is not None:
+                _write_varint(data, value)
+
+        packed = COMPACT_MARKER + urlsafe_b64encode(data).rstrip(b'=').decode()
+        if len(packed.encode()) > MAX_CALLBACK_LENGTH:
+            raise ValueError(f"Resulted callback data is too long! len({packed!r}.encode()) > {MAX_CALLBACK_LENGTH}")
+        return packed
+
+    @classmethod
+    def unpack(cls, value: str) -> 'MenuCallBack':
+        """Распаковываем колбек компактного формата или старого текстового"""
+        if not value.startswith(COMPACT_MARKER):
+            return super().unpack(value)
+        level, menu_name, category, page, product_id, quantity = _decode_compact(value[len(COMPACT_MARKER):])
+        return cls(level=level, menu_name=menu_name, category=category, page=page, product_id=product_id,
+                   quantity=quantity)
+
+
+CALLBACK_CACHE_SIZE = int(os.getenv('CALLBACK_CACHE_SIZE', 4096))  # Сколько разобранных колбеков держим в памяти
+
+
+@lru_cache(maxsize=CALLBACK_CACHE_SIZE)
+def _decode_compact(payload: str) -> tuple:
+    """Разбираем компактный колбек в (уровень, имя меню, категория, страница, товар, количество)
+
+    Пользователи нажимают одни и те же кнопки, поэтому разбор кэшируется; модель всё равно создаётся заново.
+    """
+    try:
+        data = urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        if not data or data[0] != MENU_CALLBACK_VERSION:
+            raise ValueError(f"Unsupported menu callback version in {COMPACT_MARKER + payload!r}")
+        level, position = _read_varint(data, 1)
+        code, position = _read_varint(data, position)
+        mask = data[position]
+        position += 1
+        if code:
+            menu_name = MENU_NAMES[code - 1]
+        else:
+            length, position = _read_varint(data, position)
+            menu_name = data[position:position + length].decode()
+            position += length
+        fields = [None, 1, None, None]  # Значения по умолчанию: страница 1, остальные поля пустые
+        for bit in range(4):
+            if mask >> bit & 1:
+                fields[bit], position = _read_varint(data, position)
+    except (binascii.Error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Bad menu callback data {COMPACT_MARKER + payload!r}") from e
+    return (level, menu_name, *fields)
+
+
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', 1024))  # Размер LRU-кэша клавиатур с параметрами
 
+
+@lru_cache(maxsize=None)
 def get_user_main_buttons(*, level: int, sizes: tuple[int] = (2,)):
-    """Создаём меню кнопок при вводе команды /start"""
+    """Создаём меню кнопок при вводе команды /start (статичное меню, строится один раз)"""
     keyboard = InlineKeyboardBuilder()
     buttons = {
         "Каталог": "catalog",
@@ -43,6 +153,12 @@ def get_user_main_buttons(*, level: int, sizes: tuple[int] = (2,)):
 
 def get_user_catalog_buttons(*, level: int, categories: list, sizes: tuple[int] = (2,)):
     """Создаём меню кнопок при переходе в каталог"""
+    return _get_user_catalog_buttons(level, tuple((category.id, category.name) for category in categories), sizes)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _get_user_catalog_buttons(level: int, categories: tuple[tuple[int, str], ...], sizes: tuple[int]):
+    """Строим клавиатуру каталога по (id, name) категорий"""
     keyboard = InlineKeyboardBuilder()
 
     keyboard.add(InlineKeyboardButton(text='На главную',
@@ -50,10 +166,10 @@ def get_user_catalog_buttons(*, level: int, categories: list, sizes: tuple[int]
     keyboard.add(InlineKeyboardButton(text='Корзина',
                                       callback_data=MenuCallBack(level=5, menu_name='cart').pack()))
 
-    for category in categories:
-        keyboard.add(InlineKeyboardButton(text=category.name,
-                                          callback_data=MenuCallBack(level=level + 1, menu_name=category.name,
-                                                                     category=category.id).pack()))
+    for category_id, name in categories:
+        keyboard.add(InlineKeyboardButton(text=name,
+                                          callback_data=MenuCallBack(level=level + 1, menu_name='category',
+                                                                     category=category_id).pack()))
 
     return keyboard.adjust(*sizes).as_markup()
 
@@ -68,6 +184,19 @@ def get_products_buttons(
         sizes: tuple[int] = (2, 1)
 ):
     """Создаем меню кнопок при переходе в подкатегории"""
+    return _get_products_buttons(level, category, page, tuple(pagination_buttons.items()), product_id, sizes)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _get_products_buttons(
+        level: int,
+        category: int,
+        page: int,
+        pagination_buttons: tuple[tuple[str, str], ...],
+        product_id: int,
+        sizes: tuple[int],
+):
+    """Строим клавиатуру товара с пагинацией"""
     keyboard = InlineKeyboardBuilder()
 
     keyboard.add(InlineKeyboardButton(text='В каталог',
@@ -81,7 +210,7 @@ def get_products_buttons(
     keyboard.adjust(*sizes)
 
     row = []
-    for text, menu_name in pagination_buttons.items():
+    for text, menu_name in pagination_buttons:
         if menu_name == "next":
             row.append(InlineKeyboardButton(text=text,
                                             callback_data=MenuCallBack(
@@ -109,6 +238,12 @@ def get_questions_buttons(
         sizes: tuple[int] = (2, 1)
 ):
     """Создаём меню кнопок для работы с FAQ"""
+    return _get_questions_buttons(level, page, tuple(pagination_buttons.items()), sizes)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _get_questions_buttons(level: int, page: int, pagination_buttons: tuple[tuple[str, str], ...], sizes: tuple[int]):
+    """Строим клавиатуру FAQ с пагинацией"""
     keyboard = InlineKeyboardBuilder()
 
     keyboard.add(InlineKeyboardButton(text='На главную',
@@ -117,7 +252,7 @@ def get_questions_buttons(
     keyboard.adjust(*sizes)
 
     row = []
-    for text, menu_name in pagination_buttons.items():
+    for text, menu_name in pagination_buttons:
         if menu_name == "next":
             row.append(InlineKeyboardButton(text=text,
                                             callback_data=MenuCallBack(
@@ -135,6 +270,7 @@ def get_questions_buttons(
     return keyboard.row(*row).as_markup()
 
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_user_precart(
         *,
         level: int,
@@ -185,6 +321,18 @@ def get_user_cart(
         sizes: tuple[int] = (3,)
 ):
     """Создаём меню при переходе в корзину"""
+    return _get_user_cart(level, page, tuple((pagination_buttons or {}).items()), product_id, sizes)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _get_user_cart(
+        level: int,
+        page: int | None,
+        pagination_buttons: tuple[tuple[str, str], ...],
+        product_id: int | None,
+        sizes: tuple[int],
+):
+    """Строим клавиатуру корзины с пагинацией"""
     keyboard = InlineKeyboardBuilder()
     if page:
         keyboard.add(InlineKeyboardButton(text='Удалить',
@@ -194,7 +342,7 @@ def get_user_cart(
         keyboard.adjust(*sizes)
 
         row = []
-        for text, menu_name in pagination_buttons.items():
+        for text, menu_name in pagination_buttons:
             if menu_name == "next":
                 row.append(InlineKeyboardButton(text=text,
                                                 callback_data=MenuCallBack(level=level, menu_name=menu_name,
@@ -210,7 +358,7 @@ def get_user_cart(
             InlineKeyboardButton(text='На главную',
                                  callback_data=MenuCallBack(level=0, menu_name='main').pack()),
             InlineKeyboardButton(text='Заказать',
-                                 callback_data=f'order_{product_id}'),
+                                 callback_data='order_cart'),
         ]
         return keyboard.row(*row2).as_markup()
     else:
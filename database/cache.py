@@ -0,0 +1,73 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """Простой кэш в памяти процесса с ограничением размера и временем жизни записей"""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0  # Растёт при каждом сбросе: значение, собранное до сброса, класть уже нельзя
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получаем значение из кэша, просроченные записи удаляем"""
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._data.pop(key, None)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """Кладём значение в кэш, вытесняя самые старые записи при переполнении"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Сбрасываем одну запись или весь кэш"""
+        self.generation += 1
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов"""
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+CACHE_TTL = float(os.getenv('CACHE_TTL', 300))
+
+banner_cache = TTLCache(maxsize=32, ttl=CACHE_TTL)  # Баннеры по имени страницы
+catalog_cache = TTLCache(maxsize=256, ttl=CACHE_TTL)  # Категории и подкатегории
+product_cache = TTLCache(maxsize=4096, ttl=CACHE_TTL)  # Карточки товаров по id
+menu_cache = TTLCache(maxsize=1024, ttl=CACHE_TTL)  # Готовые статичные экраны меню (картинка и клавиатура)
+
+
+def invalidate_banners(name: str | None = None) -> None:
+    """Сбрасываем кэш баннеров (после изменения баннера администратором)"""
+    banner_cache.invalidate(name)
+    menu_cache.invalidate()
+
+
+def invalidate_catalog() -> None:
+    """Сбрасываем кэш каталога и карточек товаров (после изменения категорий или товаров)"""
+    catalog_cache.invalidate()
+    product_cache.invalidate()
+    menu_cache.invalidate()
+
+
+def cache_stats() -> dict:
+    """Счётчики всех кэшей для мониторинга"""
+    return {'banner': banner_cache.stats(), 'catalog': catalog_cache.stats(),
+            'product': product_cache.stats(), 'menu': menu_cache.stats()}
@@ -0,0 +1,65 @@
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class CatalogSubCategory:
+    """Подкатегория в дереве каталога"""
+    id: int
+    name: str
+    category_id: int
+    product_count: int = 0
+
+
+@dataclass
+class CatalogCategory:
+    """Категория в дереве каталога"""
+    id: int
+    name: str
+    subcategories: dict[int, CatalogSubCategory] = field(default_factory=dict)
+
+    @property
+    def product_count(self) -> int:
+        """Количество товаров во всех подкатегориях"""
+        return sum(subcategory.product_count for subcategory in self.subcategories.values())
+
+
+class CatalogTree:
+    """Дерево каталога категория -> подкатегории с индексами по id"""
+
+    def __init__(self, rows):
+        """Строим дерево из строк (category_id, category_name, subcategory_id, subcategory_name, product_count)"""
+        self.categories: dict[int, CatalogCategory] = {}
+        self.subcategories: dict[int, CatalogSubCategory] = {}
+        for category_id, category_name, subcategory_id, subcategory_name, product_count in rows:
+            category = self.categories.setdefault(category_id, CatalogCategory(category_id, category_name))
+            if subcategory_id is not None:
+                subcategory = CatalogSubCategory(subcategory_id, subcategory_name, category_id, product_count)
+                category.subcategories[subcategory_id] = subcategory
+                self.subcategories[subcategory_id] = subcategory
+
+    def get_categories(self) -> list[CatalogCategory]:
+        """Получаем все категории"""
+        return list(self.categories.values())
+
+    def get_subcategories(self, category_id: int) -> list[CatalogSubCategory]:
+        """Получаем подкатегории категории"""
+        category = self.categories.get(int(category_id))
+        return list(category.subcategories.values()) if category else []
+
+    def has_category(self, category_id: int) -> bool:
+        """Проверяем, что категория существует"""
+        return int(category_id) in self.categories
+
+    def has_subcategory(self, category_id: int, subcategory_id: int) -> bool:
+        """Проверяем, что подкатегория существует и относится к категории"""
+        subcategory = self.subcategories.get(int(subcategory_id))
+        return subcategory is not None and subcategory.category_id == int(category_id)
+
+
+@dataclass(frozen=True)
+class ProductView:
+    """Данные товара, нужные для отрисовки карточки (без привязки к сессии БД)"""
+    id: int
+    description: str
+    image: str
+    price: int
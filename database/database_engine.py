@@ -2,24 +2,42 @@ import os
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from database.menu_steps import categories, info_pages, subcategories
+from database.metrics import InstrumentedPool
+from database.migrations import is_up_to_date, upgrade
 from database.models import Base
-from database.orm_queries import orm_create_categories, orm_add_banner_description, orm_create_subcategories
 
-engine = create_async_engine(os.getenv('DATABASE_ENGINE'), echo=True)
+
+def get_engine_options(url: str) -> dict:
+    """Собираем настройки движка и пула соединений из переменных окружения"""
+    options = {
+        'echo': os.getenv('DATABASE_ECHO', 'false').lower() in ('1', 'true', 'yes'),
+        'pool_pre_ping': os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.getenv('DATABASE_POOL_RECYCLE', 1800)),
+    }
+    if ':memory:' not in url and not url.rstrip('/').endswith(':'):  # SQLite в памяти работает только со StaticPool
+        options.update(
+            poolclass=InstrumentedPool,
+            pool_size=int(os.getenv('DATABASE_POOL_SIZE', 5)),
+            max_overflow=int(os.getenv('DATABASE_MAX_OVERFLOW', 10)),
+            pool_timeout=float(os.getenv('DATABASE_POOL_TIMEOUT', 30)),
+        )
+    return options
+
+
+engine = create_async_engine(os.getenv('DATABASE_ENGINE'), **get_engine_options(os.getenv('DATABASE_ENGINE')))
 
 session_maker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 
 async def create_db():
-    """Создаём БД и добавляем в нее категории и подкатегории"""
+    """Создаём БД, применяем миграции и добавляем в нее категории, подкатегории и баннеры"""
+    async with engine.connect() as conn:
+        if await conn.run_sync(is_up_to_date):  # Тёплый старт: один запрос
+            return
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-
-    async with session_maker() as session:
-        await orm_create_categories(session, categories)
-        await orm_create_subcategories(session, subcategories)
-        await orm_add_banner_description(session, info_pages)
+        await conn.run_sync(upgrade)
 
 
 async def drop_db():
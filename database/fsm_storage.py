@@ -0,0 +1,69 @@
+import os
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import FSMRecord
+from database.orm_queries import dialect_insert
+
+
+class SQLStorage(BaseStorage):
+    """Хранилище FSM в БД через session_maker, общее для всех процессов бота"""
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self.session_pool = session_pool
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        """Собираем строковый ключ записи из ключа aiogram"""
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _get_record(self, key: StorageKey) -> FSMRecord | None:
+        async with self.session_pool() as session:
+            return await session.get(FSMRecord, self._key(key))
+
+    async def _upsert(self, key: StorageKey, **values) -> None:
+        """Создаём или обновляем запись одним запросом (параллельная первая запись не упадёт на ключе)"""
+        row = {'key': self._key(key), 'state': None, 'data': {}, **values}
+        async with self.session_pool() as session:
+            query = dialect_insert(session, FSMRecord).values(**row)
+            query = query.on_conflict_do_update(index_elements=[FSMRecord.key], set_={**values, 'updated': func.now()})
+            await session.execute(query)
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Сохраняем состояние пользователя"""
+        await self._upsert(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        """Получаем состояние пользователя"""
+        record = await self._get_record(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        """Сохраняем данные пользователя"""
+        await self._upsert(key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        """Получаем данные пользователя"""
+        record = await self._get_record(key)
+        return dict(record.data or {}) if record else {}
+
+    async def close(self) -> None:
+        pass
+
+
+def get_fsm_storage(session_pool: async_sessionmaker) -> BaseStorage:
+    """Выбираем хранилище FSM по переменной окружения FSM_STORAGE (memory, sql или redis)"""
+    backend = os.getenv('FSM_STORAGE', 'memory')
+    if backend == 'sql':
+        return SQLStorage(session_pool)
+    if backend == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage  # Требует пакет redis
+
+        return RedisStorage.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    return MemoryStorage()
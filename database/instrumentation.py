@@ -0,0 +1,63 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+@dataclass
+class QueryStats:
+    """Количество SQL запросов и суммарное время в БД в рамках одного апдейта"""
+    count: int = 0
+    duration: float = 0.0
+    statements: list[str] = field(default_factory=list)
+
+
+class QueryBudgetExceeded(Exception):
+    """Обработчик выполнил больше SQL запросов, чем разрешено бюджетом"""
+
+
+current_query_stats: ContextVar[QueryStats | None] = ContextVar('current_query_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время начала храним в контексте самого запроса: упавший запрос не оставит его в соединении из пула
+    context._query_start = time.perf_counter()
+
+
+def _record(context, statement: str):
+    """Учитываем запрос в статистике текущего апдейта"""
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += time.perf_counter() - getattr(context, '_query_start', time.perf_counter())
+        stats.statements.append(statement)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(context, statement)
+
+
+def _handle_error(exception_context):
+    if exception_context.execution_context is not None:
+        _record(exception_context.execution_context, exception_context.statement)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подписываемся на события движка, чтобы считать запросы текущего апдейта (в том числе упавшие)"""
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine.sync_engine, 'handle_error', _handle_error)
+
+
+@contextmanager
+def count_queries():
+    """Считаем SQL запросы внутри блока (например, в тестах: assert stats.count == 2)"""
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
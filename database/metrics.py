@@ -0,0 +1,53 @@
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Счётчики пула соединений: ожидание выдачи соединения, занятые соединения, выход за pool_size"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, wait: float, overflow: int) -> None:
+        """Учитываем выдачу соединения из пула"""
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        if overflow > 0:
+            self.overflow_events += 1
+
+    def stats(self, pool=None) -> dict:
+        """Собираем метрики (и текущее состояние пула, если он передан)"""
+        stats = {
+            'checkouts': self.checkouts,
+            'overflow_events': self.overflow_events,
+            'timeouts': self.timeouts,
+            'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+        }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            stats.update(size=pool.size(), in_use=pool.checkedout(), overflow=pool.overflow())
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий время ожидания свободного соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start, self.overflow())
+        return connection
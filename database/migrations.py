@@ -0,0 +1,114 @@
+from sqlalchemy import Connection, func, insert, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+
+from database.menu_steps import categories, info_pages, subcategories
+from database.models import Banner, Cart, Category, MediaFile, Product, SchemaVersion, SubCategory
+
+
+def _add_product_price(conn: Connection):
+    """Добавляем цену товара в существующую таблицу"""
+    columns = {column['name'] for column in inspect(conn).get_columns('product')}
+    if 'price' not in columns:
+        conn.execute(text('ALTER TABLE product ADD COLUMN price INTEGER NOT NULL DEFAULT 0'))
+
+
+def _unique_cart_lines(conn: Connection):
+    """Склеиваем дубли строк корзины и запрещаем их уникальным индексом"""
+    conn.execute(text(
+        'UPDATE cart SET quantity = (SELECT SUM(c.quantity) FROM cart c '
+        'WHERE c.user_id = cart.user_id AND c.product_id = cart.product_id) '
+        'WHERE id IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1)'
+    ))
+    conn.execute(text('DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id)'))
+    _create_indexes(conn, Cart, 'ix_cart_user_id_product_id')
+
+
+def _hot_lookup_indexes(conn: Connection):
+    """Индексы под запросы меню: товары подкатегории, подкатегории категории, корзина пользователя"""
+    _create_indexes(conn, Product, 'ix_product_subcategory_id_id')
+    _create_indexes(conn, SubCategory, 'ix_subcategory_category_id')
+    _create_indexes(conn, Cart, 'ix_cart_user_id_id')
+
+
+def _create_indexes(conn: Connection, model, *names: str):
+    """Создаём описанные в модели индексы, если их ещё нет"""
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+def _seed_menu(conn: Connection):
+    """Заполняем категории, подкатегории и баннеры пачками (если таблицы ещё пустые)"""
+    if not conn.execute(select(func.count()).select_from(Category)).scalar():
+        conn.execute(insert(Category), [{'name': name} for name in categories])
+    if not conn.execute(select(func.count()).select_from(SubCategory)).scalar():
+        category_ids = dict(conn.execute(select(Category.name, Category.id)).all())
+        conn.execute(insert(SubCategory), [
+            {'category_id': category_ids[categories[category - 1]], 'name': name} for category, name in subcategories
+        ])
+    if not conn.execute(select(func.count()).select_from(Banner)).scalar():
+        conn.execute(insert(Banner), [{'name': name, 'description': description}
+                                      for name, description in info_pages.items()])
+
+
+def _product_search_indexes(conn: Connection):
+    """Полнотекстовый и триграммный индексы по описанию товара (только PostgreSQL)"""
+    if conn.dialect.name != 'postgresql':
+        return  # Для SQLite поиск идёт по инвертированному индексу в памяти
+    conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_product_description_fts ON product "
+        "USING gin (to_tsvector('russian', description))"
+    ))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_product_description_trgm ON product USING gin (description gin_trgm_ops)'
+    ))
+
+
+def _media_files(conn: Connection):
+    """Таблица file_id загруженных картинок (для баз, созданных до её появления)"""
+    MediaFile.__table__.create(conn, checkfirst=True)
+
+
+def _untracked_legacy_stock(conn: Connection):
+    """Товары, созданные до учёта остатков, получили quantity=0 по старому умолчанию - их остаток не учитываем"""
+    conn.execute(text('UPDATE product SET quantity = NULL WHERE quantity = 0'))
+
+
+def _order_status(conn: Connection):
+    """Статус заказа: оплаченные заказы, которым не хватило остатков, помечаются для менеджера"""
+    columns = {column['name'] for column in inspect(conn).get_columns('order')}
+    if 'status' not in columns:
+        conn.execute(text('ALTER TABLE "order" ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT \'paid\''))
+
+
+MIGRATIONS = [
+    (1, 'product.price', _add_product_price),
+    (2, 'unique cart lines', _unique_cart_lines),
+    (3, 'hot lookup indexes', _hot_lookup_indexes),
+    (4, 'seed menu', _seed_menu),
+    (5, 'product search indexes', _product_search_indexes),
+    (6, 'media files', _media_files),
+    (7, 'untracked legacy stock', _untracked_legacy_stock),
+    (8, 'order status', _order_status),
+]  # (версия, описание, функция) - новые миграции добавляем в конец
+
+
+def is_up_to_date(conn: Connection) -> bool:
+    """Проверяем одним запросом, что схема и начальные данные уже на последней версии"""
+    try:
+        current = conn.execute(select(func.max(SchemaVersion.version))).scalar()
+    except DBAPIError:  # Таблицы версий ещё нет (первый запуск)
+        return False
+    return current == MIGRATIONS[-1][0]
+
+
+def upgrade(conn: Connection):
+    """Применяем все миграции новее текущей версии схемы"""
+    SchemaVersion.__table__.create(conn, checkfirst=True)
+    current = conn.execute(select(SchemaVersion.version).order_by(SchemaVersion.version.desc())).scalar() or 0
+
+    for version, description, migration in MIGRATIONS:
+        if version > current:
+            migration(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(version=version, description=description))
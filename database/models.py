@@ -1,4 +1,4 @@
-from sqlalchemy import DateTime, String, Text, func, BigInteger, ForeignKey, Integer
+from sqlalchemy import DateTime, String, Text, func, BigInteger, ForeignKey, Integer, JSON, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -33,18 +33,21 @@ class SubCategory(Base):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(150), nullable=False)
 
-    category_id: Mapped[int] = mapped_column(ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    category_id: Mapped[int] = mapped_column(ForeignKey('category.id', ondelete='CASCADE'), nullable=False,
+                                             index=True)
     category: Mapped['Category'] = relationship(backref='product')
 
 
 class Product(Base):
     """Модель товаров"""
     __tablename__ = 'product'
+    __table_args__ = (Index('ix_product_subcategory_id_id', 'subcategory_id', 'id'),)  # Товары подкатегории по порядку
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     description: Mapped[str] = mapped_column(Text)
     image: Mapped[str] = mapped_column(String(150))
-    quantity: Mapped[int] = mapped_column(Integer, nullable=True, default=0)
+    price: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # В минимальных единицах валюты (копейках)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=True)  # Остаток на складе, None - остаток не учитывается
 
     subcategory_id: Mapped[int] = mapped_column(ForeignKey('subcategory.id', ondelete='CASCADE'), nullable=False)
     subcategory: Mapped['SubCategory'] = relationship(backref='product')
@@ -64,6 +67,10 @@ class User(Base):
 class Cart(Base):
     """Модель корзин"""
     __tablename__ = 'cart'
+    __table_args__ = (
+        Index('ix_cart_user_id_product_id', 'user_id', 'product_id', unique=True),  # Одна строка на товар
+        Index('ix_cart_user_id_id', 'user_id', 'id'),  # Корзина пользователя по порядку
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     city: Mapped[str] = mapped_column(String(150), nullable=True)
@@ -84,3 +91,67 @@ class Question(Base):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     question: Mapped[str] = mapped_column(String(150), nullable=True)
     answer: Mapped[str] = mapped_column(String(150), nullable=True)
+
+
+class Order(Base):
+    """Модель заказов"""
+    __tablename__ = 'order'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='SET NULL'), nullable=True, index=True)
+    total_amount: Mapped[int] = mapped_column(Integer)  # В минимальных единицах валюты (копейках)
+    currency: Mapped[str] = mapped_column(String(3))
+    name: Mapped[str] = mapped_column(String(150), nullable=True)
+    phone: Mapped[str] = mapped_column(String(20), nullable=True)
+    country_code: Mapped[str] = mapped_column(String(2), nullable=True)
+    city: Mapped[str] = mapped_column(String(150), nullable=True)
+    address: Mapped[str] = mapped_column(String(300), nullable=True)
+    post_code: Mapped[str] = mapped_column(String(20), nullable=True)
+    telegram_payment_charge_id: Mapped[str] = mapped_column(String(255), unique=True)
+    provider_payment_charge_id: Mapped[str] = mapped_column(String(255), nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default='paid', server_default='paid')  # paid или stock_shortage
+
+    user: Mapped['User'] = relationship(backref='orders')
+    items: Mapped[list['OrderItem']] = relationship(back_populates='order', cascade='all, delete-orphan')
+
+
+class OrderItem(Base):
+    """Модель позиций заказа"""
+    __tablename__ = 'order_item'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey('order.id', ondelete='CASCADE'), nullable=False, index=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey('product.id', ondelete='SET NULL'), nullable=True, index=True)
+    quantity: Mapped[int]
+    price: Mapped[int] = mapped_column(Integer)  # Цена за единицу на момент заказа
+
+    order: Mapped['Order'] = relationship(back_populates='items')
+    product: Mapped['Product'] = relationship()
+
+
+class FSMRecord(Base):
+    """Модель состояний и данных FSM (общее хранилище для нескольких процессов бота)"""
+    __tablename__ = 'fsm_record'
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=True)
+
+
+class MediaFile(Base):
+    """Модель загруженных в Telegram файлов: file_id по хэшу содержимого (file_id у каждого бота свой)"""
+    __tablename__ = 'media_file'
+    __table_args__ = (Index('ix_media_file_sha256_bot_id', 'sha256', 'bot_id', unique=True),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    sha256: Mapped[str] = mapped_column(String(64))
+    bot_id: Mapped[int] = mapped_column(BigInteger)
+    file_id: Mapped[str] = mapped_column(String(255))
+
+
+class SchemaVersion(Base):
+    """Модель применённых миграций схемы"""
+    __tablename__ = 'schema_version'
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    description: Mapped[str] = mapped_column(String(255))
@@ -1,10 +1,17 @@
+import asyncio
 import math
 
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, func, insert, literal, case, or_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
-from database.models import Banner, Cart, Category, Product, User, SubCategory, Question
+from database.cache import banner_cache, catalog_cache, invalidate_banners, invalidate_catalog, product_cache
+from database.catalog import CatalogTree, ProductView
+from database.search import InvertedIndex
+from database.models import (
+    Banner, Cart, Category, MediaFile, Product, User, SubCategory, Question, Order, OrderItem,
+)
 
 
 class Paginator:
@@ -55,14 +62,50 @@ class Paginator:
         raise IndexError(f'Previous page does not exist. Use has_previous() to check before.')
 
 
-async def orm_add_banner_description(session: AsyncSession, data: dict):
-    """Добавляем описание баннера из модели"""
-    query = select(Banner)
-    result = await session.execute(query)
-    if result.first():
-        return
-    session.add_all([Banner(name=name, description=description) for name, description in data.items()])
-    await session.commit()
+class QueryPaginator:
+    """Пагинатор по странице, полученной из БД (без загрузки всей выборки в память)"""
+
+    def __init__(self, items: list | tuple, total: int, page: int = 1, per_page: int = 1):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.len = total
+        self.pages = math.ceil(self.len / self.per_page)
+
+    def get_page(self):
+        """Получаем текущую страницу"""
+        return self.items
+
+    def has_next(self):
+        """Переходим на следующую страницу"""
+        if self.page < self.pages:
+            return self.page + 1
+        return False
+
+    def has_previous(self):
+        """Переходим на предыдущую страницу"""
+        if self.page > 1:
+            return self.page - 1
+        return False
+
+
+async def orm_paginate(session: AsyncSession, query, page: int = 1, per_page: int = 1):
+    """Получаем из БД только текущую страницу запроса и общее количество записей"""
+    count_query = select(func.count()).select_from(query.order_by(None).subquery())
+    total = (await session.execute(count_query)).scalar_one()
+    if total == 0:
+        return QueryPaginator([], 0, page=page, per_page=per_page)
+
+    page = min(max(page, 1), math.ceil(total / per_page))
+    result = await session.execute(query.offset((page - 1) * per_page).limit(per_page))
+    return QueryPaginator(result.scalars().all(), total, page=page, per_page=per_page)
+
+
+def dialect_insert(session: AsyncSession, model):
+    """Получаем INSERT с поддержкой ON CONFLICT для диалекта текущей БД (PostgreSQL или SQLite)"""
+    if session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
 
 
 async def orm_change_banner_image(session: AsyncSession, name: str, image: str):
@@ -70,13 +113,20 @@ async def orm_change_banner_image(session: AsyncSession, name: str, image: str):
     query = update(Banner).where(Banner.name == name).values(image=image)
     await session.execute(query)
     await session.commit()
+    invalidate_banners(name)
 
 
 async def orm_get_banner(session: AsyncSession, page: str):
-    """Получаем баннер из модели"""
+    """Получаем баннер из модели (через кэш)"""
+    banner = banner_cache.get(page)
+    if banner is not None:
+        return banner
     query = select(Banner).where(Banner.name == page)
     result = await session.execute(query)
-    return result.scalar()
+    banner = result.scalar()
+    if banner is not None:
+        banner_cache.set(page, banner)
+    return banner
 
 
 async def orm_get_info_pages(session: AsyncSession):
@@ -86,38 +136,50 @@ async def orm_get_info_pages(session: AsyncSession):
     return result.scalars().all()
 
 
-async def orm_get_categories(session: AsyncSession):
-    """Получаем все категории из модели"""
-    query = select(Category)
+async def orm_get_media_file_id(session: AsyncSession, sha256: str, bot_id: int) -> str | None:
+    """Получаем file_id уже загруженной этим ботом картинки по хэшу её содержимого"""
+    query = select(MediaFile.file_id).where(MediaFile.sha256 == sha256, MediaFile.bot_id == bot_id)
     result = await session.execute(query)
-    return result.scalars().all()
+    return result.scalar()
 
 
-async def orm_get_subcategories(session: AsyncSession, category_id):
-    """Получаем все подкатегории категории из модели"""
-    query = select(SubCategory).where(SubCategory.category_id == int(category_id))
-    result = await session.execute(query)
-    return result.scalars().all()
+async def orm_add_media_file(session: AsyncSession, sha256: str, bot_id: int, file_id: str):
+    """Запоминаем file_id загруженной картинки (если другой процесс успел раньше - оставляем его запись)"""
+    query = (
+        dialect_insert(session, MediaFile)
+        .values(sha256=sha256, bot_id=bot_id, file_id=file_id)
+        .on_conflict_do_nothing(index_elements=[MediaFile.sha256, MediaFile.bot_id])
+    )
+    await session.execute(query)
+    await session.commit()
 
 
-async def orm_create_categories(session: AsyncSession, categories: list):
-    """Создаем все категории в БД из списка"""
-    query = select(Category)
+async def orm_get_catalog_tree(session: AsyncSession) -> CatalogTree:
+    """Получаем дерево категорий и подкатегорий с количеством товаров одним запросом (через кэш)"""
+    tree = catalog_cache.get('tree')
+    if tree is not None:
+        return tree
+    query = (
+        select(Category.id, Category.name, SubCategory.id, SubCategory.name, func.count(Product.id))
+        .outerjoin(SubCategory, SubCategory.category_id == Category.id)
+        .outerjoin(Product, Product.subcategory_id == SubCategory.id)
+        .group_by(Category.id, Category.name, SubCategory.id, SubCategory.name)
+        .order_by(Category.id, SubCategory.id)
+    )
     result = await session.execute(query)
-    if result.first():
-        return
-    session.add_all([Category(name=name) for name in categories])
-    await session.commit()
+    tree = CatalogTree(result.all())
+    catalog_cache.set('tree', tree)
+    return tree
 
 
-async def orm_create_subcategories(session: AsyncSession, subcategories: list):
-    """Создаем все подкатегории в БД из списка"""
-    query = select(SubCategory)
-    result = await session.execute(query)
-    if result.first():
-        return
-    session.add_all([SubCategory(category_id=subcategory[0], name=subcategory[1]) for subcategory in subcategories])
-    await session.commit()
+async def orm_get_categories(session: AsyncSession):
+    """Получаем все категории (из дерева каталога)"""
+    return (await orm_get_catalog_tree(session)).get_categories()
+
+
+async def orm_get_subcategories(session: AsyncSession, category_id):
+    """Получаем все подкатегории категории (из дерева каталога)"""
+    return (await orm_get_catalog_tree(session)).get_subcategories(category_id)
 
 
 async def orm_add_product(session: AsyncSession, data: dict):
@@ -125,10 +187,12 @@ async def orm_add_product(session: AsyncSession, data: dict):
     obj = Product(
         description=data["description"],
         image=data["image"],
+        price=int(data["price"]),
         subcategory_id=int(data["subcategory"]),
     )
     session.add(obj)
     await session.commit()
+    invalidate_catalog()
 
 
 async def orm_get_products(session: AsyncSession, subcategory_id):
@@ -138,6 +202,12 @@ async def orm_get_products(session: AsyncSession, subcategory_id):
     return result.scalars().all()
 
 
+async def orm_get_products_page(session: AsyncSession, subcategory_id, page: int = 1, per_page: int = 1):
+    """Получаем страницу товаров подкатегории"""
+    query = select(Product).where(Product.subcategory_id == int(subcategory_id)).order_by(Product.id)
+    return await orm_paginate(session, query, page=page, per_page=per_page)
+
+
 async def orm_get_product(session: AsyncSession, product_id: int):
     """Получаем товар"""
     query = select(Product).where(Product.id == product_id)
@@ -145,6 +215,76 @@ async def orm_get_product(session: AsyncSession, product_id: int):
     return result.scalar()
 
 
+async def orm_add_products_bulk(session: AsyncSession, rows: list[dict]):
+    """Добавляем пачку товаров одним INSERT в одной транзакции
+
+    Кэш каталога не сбрасываем: импорт делает это один раз, после последней пачки.
+    """
+    if not rows:
+        return
+    await session.execute(insert(Product), rows)
+    await session.commit()
+
+
+async def orm_stream_products(session: AsyncSession, batch_size: int = 1000):
+    """Потоково читаем все товары с названиями категорий и подкатегорий (без загрузки всей таблицы в память)"""
+    query = (
+        select(Product.description, Product.price, Category.name, SubCategory.name, Product.image, Product.quantity)
+        .join(SubCategory, Product.subcategory_id == SubCategory.id)
+        .join(Category, SubCategory.category_id == Category.id)
+        .order_by(Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await session.stream(query)
+    async for row in result:
+        yield row
+
+
+async def orm_get_product_view(session: AsyncSession, product_id: int) -> ProductView | None:
+    """Получаем карточку товара (через кэш)"""
+    view = product_cache.get(product_id)
+    if view is not None:
+        return view
+    query = select(Product.id, Product.description, Product.image, Product.price).where(Product.id == product_id)
+    row = (await session.execute(query)).first()
+    if row is None:
+        return None
+    view = ProductView(*row)
+    product_cache.set(product_id, view)
+    return view
+
+
+async def orm_search_products(session: AsyncSession, text: str, offset: int = 0, limit: int = 10):
+    """Ищем товары по описанию с ранжированием: в PostgreSQL через tsvector и триграммы, иначе через индекс в памяти"""
+    if session.get_bind().dialect.name == 'postgresql':
+        document = func.to_tsvector('russian', Product.description)
+        ts_query = func.plainto_tsquery('russian', text)
+        rank = func.ts_rank(document, ts_query) + func.similarity(Product.description, text)
+        query = (
+            select(Product)
+            .where(document.op('@@')(ts_query) | Product.description.op('%')(text))
+            .order_by(rank.desc(), Product.id)
+            .offset(offset)
+            .limit(limit)
+        )
+        result = await session.execute(query)
+        return result.scalars().all()
+
+    index = catalog_cache.get('search_index')
+    if index is None:
+        generation = catalog_cache.generation
+        rows = (await session.execute(select(Product.id, Product.description))).all()
+        index = await asyncio.to_thread(InvertedIndex, rows)  # На большом каталоге это доли секунды CPU
+        if catalog_cache.generation == generation:
+            catalog_cache.set('search_index', index, ttl=math.inf)  # Пересобираем только после invalidate_catalog
+    product_ids = index.search(text, offset=offset, limit=limit)
+    if not product_ids:
+        return []
+    products = {product.id: product for product in
+                (await session.execute(select(Product).where(Product.id.in_(product_ids)))).scalars()}
+    return [products[product_id] for product_id in product_ids if product_id in products]
+
+
 async def orm_update_product(session: AsyncSession, product_id: int, data):
     """Изменяем товар"""
     query = (
@@ -153,11 +293,13 @@ async def orm_update_product(session: AsyncSession, product_id: int, data):
         .values(
             description=data["description"],
             image=data["image"],
-            category_id=int(data["category"]),
+            price=int(data["price"]),
+            subcategory_id=int(data["subcategory"]),
         )
     )
     await session.execute(query)
     await session.commit()
+    invalidate_catalog()
 
 
 async def orm_delete_product(session: AsyncSession, product_id: int):
@@ -165,6 +307,7 @@ async def orm_delete_product(session: AsyncSession, product_id: int):
     query = delete(Product).where(Product.id == product_id)
     await session.execute(query)
     await session.commit()
+    invalidate_catalog()
 
 
 async def orm_add_user(
@@ -174,28 +317,25 @@ async def orm_add_user(
         last_name: str | None = None,
         phone: str | None = None,
 ):
-    """Добавляем пользователя"""
-    query = select(User).where(User.user_id == user_id)
-    result = await session.execute(query)
-    if result.first() is None:
-        session.add(
-            User(user_id=user_id, first_name=first_name, last_name=last_name, phone=phone)
-        )
-        await session.commit()
+    """Добавляем пользователя, если его ещё нет (одним запросом)"""
+    query = (
+        dialect_insert(session, User)
+        .values(user_id=user_id, first_name=first_name, last_name=last_name, phone=phone)
+        .on_conflict_do_nothing(index_elements=[User.user_id])
+    )
+    await session.execute(query)
+    await session.commit()
 
 
 async def orm_add_to_cart(session: AsyncSession, user_id: int, product_id: int, quantity: int):
-    """Создаём корзину, если ее нет у пользователя или добавляем в нее товар"""
-    query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id).options(joinedload(Cart.product))
-    cart = await session.execute(query)
-    cart = cart.scalar()
-    if cart:
-        cart.quantity += quantity
-        await session.commit()
-        return cart
-    else:
-        session.add(Cart(user_id=user_id, product_id=product_id, quantity=quantity))
-        await session.commit()
+    """Создаём корзину, если ее нет у пользователя или добавляем в нее товар (одним запросом)"""
+    query = dialect_insert(session, Cart).values(user_id=user_id, product_id=product_id, quantity=quantity)
+    query = query.on_conflict_do_update(
+        index_elements=[Cart.user_id, Cart.product_id],
+        set_={'quantity': Cart.quantity + query.excluded.quantity, 'updated': func.now()},
+    )
+    await session.execute(query)
+    await session.commit()
 
 
 async def orm_get_user_carts(session: AsyncSession, user_id):
@@ -205,6 +345,12 @@ async def orm_get_user_carts(session: AsyncSession, user_id):
     return result.scalars().all()
 
 
+async def orm_get_user_carts_page(session: AsyncSession, user_id, page: int = 1, per_page: int = 1):
+    """Получаем страницу товаров из корзины пользователя"""
+    query = select(Cart).filter(Cart.user_id == user_id).options(joinedload(Cart.product)).order_by(Cart.id)
+    return await orm_paginate(session, query, page=page, per_page=per_page)
+
+
 async def orm_delete_from_cart(session: AsyncSession, user_id: int, product_id: int):
     """Удаляем товар из корзины"""
     query = delete(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id)
@@ -212,6 +358,50 @@ async def orm_delete_from_cart(session: AsyncSession, user_id: int, product_id:
     await session.commit()
 
 
+async def orm_get_cart_invoice(session: AsyncSession, user_id: int):
+    """Получаем позиции корзины с суммами и итогом корзины одним запросом"""
+    query = (
+        select(
+            Product.id,
+            Product.description,
+            Cart.quantity,
+            (Product.price * Cart.quantity).label('amount'),
+            func.sum(Product.price * Cart.quantity).over().label('total'),
+        )
+        .select_from(Cart)
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id)
+        .order_by(Cart.id)
+    )
+    result = await session.execute(query)
+    return result.all()
+
+
+async def orm_check_cart(session: AsyncSession, user_id: int):
+    """Пересчитываем итог корзины и количество позиций, которые нельзя оплатить (одним запросом)
+
+    Позиция не оплачивается, если её не хватает на складе или у товара ещё нет цены.
+    """
+    query = (
+        select(
+            func.coalesce(func.sum(Product.price * Cart.quantity), 0),
+            func.coalesce(func.sum(case((or_(Product.quantity < Cart.quantity, Product.price <= 0), 1), else_=0)), 0),
+        )
+        .select_from(Cart)
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id)
+    )
+    total, out_of_stock = (await session.execute(query)).one()
+    return total, out_of_stock
+
+
+async def orm_clear_cart(session: AsyncSession, user_id: int):
+    """Очищаем корзину пользователя одним запросом"""
+    query = delete(Cart).where(Cart.user_id == user_id)
+    await session.execute(query)
+    await session.commit()
+
+
 async def orm_reduce_product_in_cart(session: AsyncSession, user_id: int, product_id: int):
     """Изменяем товар из корзины"""
     query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id).options(joinedload(Cart.product))
@@ -235,3 +425,63 @@ async def orm_get_questions(session: AsyncSession):
     query = select(Question)
     result = await session.execute(query)
     return result.scalars().all()
+
+
+async def orm_get_questions_page(session: AsyncSession, page: int = 1, per_page: int = 1):
+    """Получаем страницу вопросов"""
+    query = select(Question).order_by(Question.id)
+    return await orm_paginate(session, query, page=page, per_page=per_page)
+
+
+ORDER_STOCK_SHORTAGE = 'stock_shortage'  # Заказ оплачен, но остатков на него не хватило
+
+
+async def orm_create_order(session: AsyncSession, user_id: int, data: dict):
+    """Создаём заказ из корзины пользователя и очищаем корзину (в одной транзакции)
+
+    Остатки списываются только там, где их хватает (WHERE quantity >= количество в корзине). Если хоть одна
+    учитываемая позиция не списалась (её успел купить другой покупатель), списание откатывается, а заказ
+    помечается статусом stock_shortage.
+    """
+    order = Order(user_id=user_id, **data)
+    session.add(order)
+    await session.flush()
+
+    items = (
+        select(literal(order.id), Cart.product_id, Cart.quantity, Product.price)
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id)
+    )
+    await session.execute(
+        insert(OrderItem).from_select(
+            [OrderItem.order_id, OrderItem.product_id, OrderItem.quantity, OrderItem.price], items
+        )
+    )
+    tracked_lines = (await session.execute(
+        select(func.count())
+        .select_from(Cart)
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id, Product.quantity.is_not(None))
+    )).scalar()
+    cart_quantity = (
+        select(Cart.quantity).where(Cart.user_id == user_id, Cart.product_id == Product.id).scalar_subquery()
+    )
+    savepoint = await session.begin_nested()
+    result = await session.execute(
+        update(Product)
+        .where(
+            Product.quantity.is_not(None),
+            Product.id.in_(select(Cart.product_id).where(Cart.user_id == user_id)),
+            Product.quantity >= cart_quantity,
+        )
+        .values(quantity=Product.quantity - cart_quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == tracked_lines:
+        await savepoint.commit()
+    else:
+        await savepoint.rollback()
+        order.status = ORDER_STOCK_SHORTAGE
+    await session.execute(delete(Cart).where(Cart.user_id == user_id))
+    await session.commit()
+    return order
@@ -0,0 +1,47 @@
+import heapq
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list[str]:
+    """Разбиваем текст на слова в нижнем регистре (ё приравниваем к е)"""
+    return TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+class InvertedIndex:
+    """Инвертированный индекс по описаниям товаров (для БД без полнотекстового поиска, например SQLite)"""
+
+    def __init__(self, rows):
+        """Строим индекс из пар (id товара, описание)"""
+        postings: dict[str, set[int]] = defaultdict(set)
+        for product_id, description in rows:
+            for token in tokenize(description):
+                postings[token].add(product_id)
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+
+    def _prefix_matches(self, prefix: str):
+        """Слова словаря, начинающиеся с prefix"""
+        start = bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def search(self, query: str, offset: int = 0, limit: int = 10) -> list[int]:
+        """Ищем товары: точное совпадение слова весит больше, чем совпадение по началу слова"""
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            matched: dict[int, float] = {}
+            for token in self._prefix_matches(term):
+                weight = 2.0 if token == term else 1.0
+                for product_id in self.postings[token]:
+                    matched[product_id] = max(matched.get(product_id, 0.0), weight)
+            for product_id, weight in matched.items():
+                scores[product_id] += weight
+
+        ranked = heapq.nsmallest(offset + limit, scores, key=lambda product_id: (-scores[product_id], product_id))
+        return ranked[offset:]
@@ -1,11 +1,22 @@
+import asyncio
+import json
+import logging
 import os
+import time
 
 from openpyxl import load_workbook
 from openpyxl.workbook import Workbook
 
+logger = logging.getLogger(__name__)
+
 
 def add_row_to_excel(file_path, sheet_name, row_data):
     """Создаём файл excel если его нет, добавляем данные в конец файла"""
+    append_rows_to_excel(file_path, sheet_name, [row_data])
+
+
+def append_rows_to_excel(file_path, sheet_name, rows):
+    """Добавляем пачку строк в файл excel за одно открытие и сохранение"""
     if os.path.exists(file_path):
         workbook = load_workbook(filename=file_path)
     else:
@@ -13,5 +24,160 @@ def add_row_to_excel(file_path, sheet_name, row_data):
         workbook.create_sheet(title=sheet_name)
 
     sheet = workbook[sheet_name]
-    sheet.append(row_data)
+    for row_data in rows:
+        sheet.append(row_data)
     workbook.save(file_path)
+
+
+def append_rows_to_jsonl(file_path, rows):
+    """Дописываем строки в конец JSONL файла (без чтения файла)"""
+    with open(file_path, 'a', encoding='utf-8') as file:
+        for row_data in rows:
+            file.write(json.dumps(row_data, ensure_ascii=False, default=str) + '\n')
+
+
+def compact_jsonl_to_excel(jsonl_path, file_path, sheet_name):
+    """Собираем excel из JSONL журнала в потоковом (write-only) режиме"""
+    if not os.path.exists(jsonl_path):
+        return
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_name)
+    with open(jsonl_path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                sheet.append(json.loads(line))
+
+    tmp_path = f'{file_path}.tmp'
+    workbook.save(tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+class OrderExporter:
+    """Фоновая выгрузка заказов: строки копятся в очереди и пишутся пачками в отдельном потоке"""
+
+    def __init__(
+            self,
+            file_path: str,
+            sheet_name: str,
+            export_format: str = 'xlsx',
+            batch_size: int = 100,
+            flush_interval: float = 1.0,
+            compact_interval: float = 300.0,
+            retry_interval: float = 5.0,
+    ):
+        self.file_path = file_path
+        self.sheet_name = sheet_name
+        self.export_format = export_format
+        self.jsonl_path = f'{os.path.splitext(file_path)[0]}.jsonl'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.retry_interval = retry_interval
+        self.failures = 0
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._dirty = False
+        self._last_compact = time.monotonic()
+        self._failed_rows: list = []  # Строки, которые не удалось записать; пишем их первыми при следующей попытке
+
+    def stats(self) -> dict:
+        """Размер очереди, строки, ждущие повторной записи, и число ошибок записи"""
+        return {'queued': self.queue.qsize(), 'failed_rows': len(self._failed_rows), 'failures': self.failures}
+
+    def put(self, row_data: list) -> None:
+        """Ставим строку в очередь на выгрузку, не дожидаясь записи на диск"""
+        self.queue.put_nowait(row_data)
+
+    async def start(self) -> None:
+        """Запускаем фоновую задачу выгрузки"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        """Останавливаем выгрузку, дописав всё, что осталось в очереди"""
+        if self._task is None:
+            return
+        self.queue.put_nowait(None)  # Сигнал воркеру завершиться после записи очереди
+        await self._task
+        self._task = None
+
+    async def _collect_batch(self) -> tuple[list, bool]:
+        """Ждём первую строку и добираем остальные в пределах batch_size и flush_interval"""
+        rows = []
+        deadline = None
+        while len(rows) < self.batch_size:
+            if deadline is None:
+                timeout = self.retry_interval if self._failed_rows else self.compact_interval
+            else:
+                timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row_data = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if row_data is None:
+                return rows, True
+            rows.append(row_data)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return rows, False
+
+    async def _write(self, rows: list) -> None:
+        """Пишем пачку строк в отдельном потоке, чтобы не блокировать event loop"""
+        loop = asyncio.get_running_loop()
+        if self.export_format == 'xlsx':
+            await loop.run_in_executor(None, append_rows_to_excel, self.file_path, self.sheet_name, rows)
+        else:
+            await loop.run_in_executor(None, append_rows_to_jsonl, self.jsonl_path, rows)
+            self._dirty = True
+
+    async def _compact(self) -> None:
+        """Пересобираем excel из JSONL журнала, если были новые строки"""
+        if self.export_format == 'xlsx' or not self._dirty:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, compact_jsonl_to_excel, self.jsonl_path, self.file_path, self.sheet_name)
+        self._dirty = False
+        self._last_compact = time.monotonic()
+
+    async def _flush(self, rows: list) -> None:
+        """Пишем пачку вместе с ранее не записанными строками; при ошибке оставляем их до следующей попытки"""
+        rows = self._failed_rows + rows
+        if not rows:
+            return
+        try:
+            await self._write(rows)
+        except Exception:  # Файл занят или повреждён, нет места на диске - воркер должен продолжить работу
+            self.failures += 1
+            self._failed_rows = rows
+            logger.exception("Order export failed, %s rows will be retried", len(rows))
+        else:
+            self._failed_rows = []
+
+    async def _try_compact(self) -> None:
+        """Собираем excel, не останавливая воркер при ошибке (журнал остаётся, соберём в следующий раз)"""
+        try:
+            await self._compact()
+        except Exception:
+            self.failures += 1
+            logger.exception("Order export compaction failed")
+
+    async def _worker(self) -> None:
+        stopping = False
+        while not stopping:
+            rows, stopping = await self._collect_batch()
+            await self._flush(rows)
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                await self._try_compact()
+        await self._try_compact()
+        if self._failed_rows:
+            logger.error("Order export stopped with %s unsaved rows: %s", len(self._failed_rows), self._failed_rows)
+
+
+order_exporter = OrderExporter(
+    file_path=os.getenv('ORDERS_FILE', './orders.xlsx'),
+    sheet_name='Orders',
+    export_format=os.getenv('ORDERS_EXPORT_FORMAT', 'xlsx'),  # xlsx или jsonl (с периодической сборкой в xlsx)
+)
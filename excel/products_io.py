@@ -0,0 +1,71 @@
+import csv
+import os
+from decimal import Decimal, InvalidOperation
+
+from openpyxl import load_workbook
+from openpyxl.workbook import Workbook
+
+from database.catalog import CatalogTree
+
+PRODUCT_COLUMNS = ['description', 'price', 'category', 'subcategory', 'image', 'quantity']  # Заголовок файла
+
+
+def read_product_rows(file_path):
+    """Построчно читаем товары из .xlsx (read-only режим) или .csv, не загружая файл целиком"""
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        with open(file_path, newline='', encoding='utf-8-sig') as file:
+            dialect = csv.Sniffer().sniff(file.read(4096), delimiters=',;')  # Excel часто сохраняет CSV через ;
+            file.seek(0)
+            yield from csv.reader(file, dialect)
+        return
+
+    workbook = load_workbook(filename=file_path, read_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def parse_product_row(row, tree: CatalogTree) -> dict:
+    """Проверяем строку файла по каталогу и приводим к данным товара; ValueError, если строка неверная"""
+    values = dict(zip(PRODUCT_COLUMNS, [str(value).strip() if value is not None else '' for value in row]))
+    if not values.get('description'):
+        raise ValueError('нет описания')
+    if not values.get('image'):
+        raise ValueError('нет изображения (file_id или имя файла)')
+
+    try:
+        price = Decimal(values.get('price', '').replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"неверная цена «{values.get('price')}»")
+    if not price.is_finite() or price <= 0:
+        raise ValueError(f"неверная цена «{values.get('price')}»")
+
+    category = next((item for item in tree.get_categories()
+                     if values.get('category') in (str(item.id), item.name)), None)
+    if category is None:
+        raise ValueError(f"нет категории «{values.get('category')}»")
+    subcategory = next((item for item in tree.get_subcategories(category.id)
+                        if values.get('subcategory') in (str(item.id), item.name)), None)
+    if subcategory is None:
+        raise ValueError(f"нет подкатегории «{values.get('subcategory')}» в категории «{category.name}»")
+
+    quantity = values.get('quantity')
+    if quantity and not quantity.isdigit():
+        raise ValueError(f"неверный остаток «{quantity}»")
+
+    return {
+        'description': values['description'],
+        'image': values['image'],
+        'price': int((price * 100).to_integral_value()),
+        'quantity': int(quantity) if quantity else None,
+        'subcategory_id': subcategory.id,
+    }
+
+
+def create_products_workbook():
+    """Создаём .xlsx в потоковом (write-only) режиме с заголовком; строки дописываем в sheet по мере чтения из БД"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title='Products')
+    sheet.append(PRODUCT_COLUMNS)
+    return workbook, sheet
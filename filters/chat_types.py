@@ -1,11 +1,27 @@
+import asyncio
 import os
 
 from aiogram import Bot, types
+from aiogram.enums import ChatMemberStatus
 from aiogram.filters import Filter
 from dotenv import load_dotenv, find_dotenv
 
+from database.cache import TTLCache
+
 load_dotenv(find_dotenv())
 
+MEMBERSHIP_POSITIVE_TTL = float(os.getenv('MEMBERSHIP_POSITIVE_TTL', 600))  # Подписан: проверяем раз в 10 минут
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv('MEMBERSHIP_NEGATIVE_TTL', 30))  # Не подписан: перепроверяем быстро
+
+membership_cache = TTLCache(maxsize=int(os.getenv('MEMBERSHIP_CACHE_SIZE', 10_000)), ttl=MEMBERSHIP_POSITIVE_TTL)
+
+NOT_MEMBER_STATUSES = (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED)
+
+
+def invalidate_membership(user_id: int) -> None:
+    """Сбрасываем закэшированный статус подписки пользователя"""
+    membership_cache.invalidate(user_id)
+
 
 class ChatTypeFilter(Filter):
     """Регулируем типы чатов"""
@@ -17,15 +33,35 @@ class ChatTypeFilter(Filter):
         return message.chat.type in self.chat_types
 
 
+class IsAdmin(Filter):
+    """Пропускаем только администраторов: id пользователей из ADMIN_IDS через запятую"""
+
+    def __init__(self) -> None:
+        self.admin_ids = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if user_id}
+
+    async def __call__(self, event: types.Message | types.CallbackQuery) -> bool:
+        return event.from_user is not None and event.from_user.id in self.admin_ids
+
+
 class UserInGroupAndChannelFilter(Filter):
     """Проверяем на то, подписан пользователь на группу и канал"""
 
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
+        self.chat_ids = (os.getenv('GROUP_ID'), os.getenv('CHANNEL_ID'))
 
-    async def __call__(self, message: types.Message) -> bool:
-        user_in_group = await self.bot.get_chat_member(chat_id=os.getenv('GROUP_ID'), user_id=message.from_user.id)
-        user_in_channel = await self.bot.get_chat_member(chat_id=os.getenv('CHANNEL_ID'), user_id=message.from_user.id)
+    async def is_member(self, user_id: int) -> bool:
+        """Запрашиваем статус пользователя в группе и канале параллельно"""
+        members = await asyncio.gather(
+            *(self.bot.get_chat_member(chat_id=chat_id, user_id=user_id) for chat_id in self.chat_ids)
+        )
+        return all(member.status not in NOT_MEMBER_STATUSES for member in members)
 
-        if user_in_group and user_in_channel:
-            return True
+    async def __call__(self, message: types.Message) -> bool:
+        user_id = message.from_user.id
+        is_member = membership_cache.get(user_id)
+        if is_member is None:
+            is_member = await self.is_member(user_id)
+            membership_cache.set(user_id, is_member,
+                                 ttl=MEMBERSHIP_POSITIVE_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL)
+        return is_member
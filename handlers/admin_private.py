@@ -1,4 +1,10 @@
-from aiogram import F, Router, types
+import asyncio
+import os
+import tempfile
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from aiogram import Bot, F, Router, types
 from aiogram.filters import Command, StateFilter, or_f
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -6,38 +12,56 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from buttons.inline_buttons import get_callback_buttons
 from buttons.reply_buttons import get_keyboard
+from database.cache import cache_stats, invalidate_catalog
 from database.orm_queries import (
     orm_change_banner_image,
     orm_get_categories,
     orm_add_product,
     orm_get_info_pages,
-    orm_update_product, orm_get_subcategories,
+    orm_update_product, orm_get_catalog_tree, orm_add_products_bulk, orm_stream_products,
 )
-from filters.chat_types import ChatTypeFilter
+from excel.products_io import PRODUCT_COLUMNS, create_products_workbook, parse_product_row, read_product_rows
+from filters.chat_types import ChatTypeFilter, IsAdmin
+from handlers.menu_processing import build_menu_snapshots
+from telegram_api.media import media_storage
 
 admin_router = Router()
-admin_router.message.filter(ChatTypeFilter(["private"]))
+admin_router.message.filter(ChatTypeFilter(["private"]), IsAdmin())
+admin_router.callback_query.filter(IsAdmin())
 
 ADMIN_KB = get_keyboard(
     "Добавить товар",
     "Добавить/Изменить баннер",
+    "Импорт товаров",
+    "Выгрузить товары",
     placeholder="Выберите действие",
     sizes=(2,),
 )
 
+IMPORT_BATCH_SIZE = 500  # Строк файла на одну транзакцию
+IMPORT_MAX_ERRORS_SHOWN = 20
+
 
-@admin_router.message(Command("admin"))
+@admin_router.message(Command("admin"), flags={'db': False})
 async def admin_command(message: types.Message):
     """Обрабатываем команду /admin"""
     await message.answer('Добрый день, я виртуальный помощник для администраторов "BOTTEC", чем я могу быть полезен?',
                          reply_markup=ADMIN_KB)
 
 
+@admin_router.message(Command("cache"), flags={'db': False})
+async def cache_command(message: types.Message):
+    """Выводим счётчики попаданий и промахов кэша"""
+    lines = [f"{name}: {stats['hits']} попаданий, {stats['misses']} промахов, {stats['size']} записей"
+             for name, stats in cache_stats().items()]
+    await message.answer('\n'.join(lines))
+
+
 class AddBanner(StatesGroup):
     image = State()
 
 
-@admin_router.message(StateFilter(None), F.text == 'Добавить баннер')
+@admin_router.message(StateFilter(None), F.text == 'Добавить/Изменить баннер')
 async def start_add_banner(message: types.Message, state: FSMContext, session: AsyncSession):
     """Инициализируем добавление баннера"""
     pages_names = [page.name for page in await orm_get_info_pages(session)]
@@ -57,6 +81,7 @@ async def add_banner(message: types.Message, state: FSMContext, session: AsyncSe
                          \n{', '.join(pages_names)}")
         return
     await orm_change_banner_image(session, for_page, image_id, )
+    await build_menu_snapshots(session)
     await message.answer("Баннер добавлен.")
     await state.clear()
 
@@ -69,14 +94,14 @@ async def add_banner_exception_error(message: types.Message, state: FSMContext):
 
 class AddProduct(StatesGroup):
     description = State()
+    price = State()
     category = State()
     subcategory = State()
     image = State()
 
-    product_for_change = None
-
     texts = {
         "AddProduct:description": "Введите описание заново:",
+        "AddProduct:price": "Введите стоимость заново:",
         "AddProduct:category": "Выберите категорию  заново",
         "AddProduct:subcategory": "Выберите подкатегорию  заново",
         "AddProduct:image": "Этот шаг последний",
@@ -98,8 +123,6 @@ async def cancel_handler(message: types.Message, state: FSMContext) -> None:
     current_state = await state.get_state()
     if current_state is None:
         return
-    if AddProduct.product_for_change:
-        AddProduct.product_for_change = None
     await state.clear()
     await message.answer("Действия отменены", reply_markup=ADMIN_KB)
 
@@ -130,6 +153,27 @@ async def back_step_handler(message: types.Message, state: FSMContext) -> None:
 async def add_description(message: types.Message, state: FSMContext, session: AsyncSession):
     """Добавляем описание к товару"""
     await state.update_data(description=message.text)
+    await message.answer("Введите стоимость товара в рублях, например 1990.50")
+    await state.set_state(AddProduct.price)
+
+
+@admin_router.message(AddProduct.description)
+async def add_description_exception_error(message: types.Message, state: FSMContext):
+    """Обрабатываем неверно введенные данные"""
+    await message.answer("Вы ввели не допустимые данные, введите текст описания товара")
+
+
+@admin_router.message(AddProduct.price, F.text)
+async def add_price(message: types.Message, state: FSMContext, session: AsyncSession):
+    """Добавляем стоимость к товару (храним в копейках)"""
+    try:
+        price = Decimal(message.text.replace(',', '.').strip())
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or price <= 0:
+        await message.answer("Введите корректное значение стоимости, например 1990.50")
+        return
+    await state.update_data(price=int((price * 100).to_integral_value()))
 
     categories = await orm_get_categories(session)
     buttons = {category.name: str(category.id) for category in categories}
@@ -137,18 +181,19 @@ async def add_description(message: types.Message, state: FSMContext, session: As
     await state.set_state(AddProduct.category)
 
 
-@admin_router.message(AddProduct.description)
-async def add_description_exception_error(message: types.Message, state: FSMContext):
+@admin_router.message(AddProduct.price)
+async def add_price_exception_error(message: types.Message, state: FSMContext):
     """Обрабатываем неверно введенные данные"""
-    await message.answer("Вы ввели не допустимые данные, введите текст описания товара")
+    await message.answer("Вы ввели не допустимые данные, введите стоимость товара")
 
 
 @admin_router.callback_query(AddProduct.category)
 async def category_choice(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
-    if int(callback.data) in [category.id for category in await orm_get_categories(session)]:
+    tree = await orm_get_catalog_tree(session)
+    if callback.data.isdigit() and tree.has_category(int(callback.data)):
         await callback.answer()
         await state.update_data(category=callback.data)
-        subcategories = await orm_get_subcategories(session, category_id=int(callback.data))
+        subcategories = tree.get_subcategories(int(callback.data))
         buttons = {subcategory.name: str(subcategory.id) for subcategory in subcategories}
         await callback.message.answer("Выберите подкатегорию", reply_markup=get_callback_buttons(buttons=buttons))
         await state.set_state(AddProduct.subcategory)
@@ -167,8 +212,8 @@ async def category_choice_exception_error(message: types.Message, state: FSMCont
 async def subcategory_choice(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     """Добавляем подкатегорию к товару"""
     data = await state.get_data()
-    if int(callback.data) in [subcategory.id for subcategory in
-                              await orm_get_subcategories(session, category_id=int(data.get('category')))]:
+    tree = await orm_get_catalog_tree(session)
+    if callback.data.isdigit() and tree.has_subcategory(int(data.get('category')), int(callback.data)):
         await callback.answer()
         await state.update_data(subcategory=callback.data)
         await callback.message.answer("Загрузите изображение товара")
@@ -187,8 +232,9 @@ async def subcategory_choice_exception_error(message: types.Message, state: FSMC
 @admin_router.message(AddProduct.image, or_f(F.photo, F.text == "."))
 async def add_image(message: types.Message, state: FSMContext, session: AsyncSession):
     """Добавляем картинку к товару"""
-    if message.text and message.text == "." and AddProduct.product_for_change:
-        await state.update_data(image=AddProduct.product_for_change.image)
+    product_for_change = (await state.get_data()).get('product_for_change')  # {'id': ..., 'image': ...} при изменении
+    if message.text and message.text == "." and product_for_change:
+        await state.update_data(image=product_for_change['image'])
 
     elif message.photo:
         await state.update_data(image=message.photo[-1].file_id)
@@ -197,10 +243,11 @@ async def add_image(message: types.Message, state: FSMContext, session: AsyncSes
         return
     data = await state.get_data()
     try:
-        if AddProduct.product_for_change:
-            await orm_update_product(session, AddProduct.product_for_change.id, data)
+        if product_for_change:
+            await orm_update_product(session, product_for_change['id'], data)
         else:
             await orm_add_product(session, data)
+        await build_menu_snapshots(session)
         await message.answer("Товар добавлен/изменен", reply_markup=ADMIN_KB)
         await state.clear()
 
@@ -211,10 +258,102 @@ async def add_image(message: types.Message, state: FSMContext, session: AsyncSes
         )
         await state.clear()
 
-    AddProduct.product_for_change = None
-
 
 @admin_router.message(AddProduct.image)
 async def add_image_exception_error(message: types.Message, state: FSMContext):
     """Обрабатываем неверно введенные данные"""
     await message.answer("Отправьте фото!")
+
+
+class ImportProducts(StatesGroup):
+    file = State()
+
+
+@admin_router.message(StateFilter(None), F.text == "Импорт товаров", flags={'db': False})
+async def start_import_products(message: types.Message, state: FSMContext):
+    """Инициализируем массовый импорт товаров"""
+    await message.answer(
+        "Отправьте файл .xlsx или .csv с колонками:\n"
+        f"{', '.join(PRODUCT_COLUMNS)}\n"
+        "Категорию и подкатегорию можно указать названием или id, цену - в рублях, остаток - необязательно.\n"
+        "Изображение - file_id или имя файла из папки MEDIA_DIR на сервере (загрузим его один раз).",
+        reply_markup=types.ReplyKeyboardRemove(),
+    )
+    await state.set_state(ImportProducts.file)
+
+
+@admin_router.message(ImportProducts.file, F.document)
+async def import_products(message: types.Message, state: FSMContext, session: AsyncSession, bot: Bot):
+    """Импортируем товары из файла: читаем потоково, проверяем строки и добавляем пачками"""
+    extension = os.path.splitext(message.document.file_name or '')[1].lower()
+    if extension not in ('.xlsx', '.csv'):
+        await message.answer("Нужен файл .xlsx или .csv")
+        return
+
+    file_descriptor, file_path = tempfile.mkstemp(suffix=extension)
+    os.close(file_descriptor)
+    loop = asyncio.get_running_loop()
+    tree = await orm_get_catalog_tree(session)
+    status = await message.answer("Импорт начат...")
+    line, imported, errors = 0, 0, []
+    rows = None
+    try:
+        await bot.download(message.document, destination=file_path)
+        rows = read_product_rows(file_path)
+        while chunk := await loop.run_in_executor(None, lambda: list(islice(rows, IMPORT_BATCH_SIZE))):
+            batch = []
+            for row in chunk:
+                line += 1
+                if line == 1 and row and str(row[0]).strip().lower() == PRODUCT_COLUMNS[0]:
+                    continue  # Заголовок
+                if not any(value not in (None, '') for value in row):
+                    continue
+                try:
+                    product = parse_product_row(row, tree)
+                    product['image'] = await media_storage.resolve(bot, session, product['image'])
+                    batch.append(product)
+                except ValueError as e:
+                    errors.append(f"Строка {line}: {e}")
+            await orm_add_products_bulk(session, batch)
+            imported += len(batch)
+            await status.edit_text(f"Обработано строк: {line}, добавлено товаров: {imported}, ошибок: {len(errors)}")
+    except Exception as e:
+        await session.rollback()
+        errors.append(f"Импорт прерван: {e}")
+    finally:
+        if rows is not None:
+            rows.close()  # Закрываем книгу или CSV до удаления файла
+        os.remove(file_path)
+
+    if imported:
+        invalidate_catalog()
+        await build_menu_snapshots(session)
+    report = f"Импорт завершён. Добавлено товаров: {imported}, ошибок: {len(errors)}."
+    if errors:
+        report += "\n" + "\n".join(errors[:IMPORT_MAX_ERRORS_SHOWN])
+        if len(errors) > IMPORT_MAX_ERRORS_SHOWN:
+            report += f"\n... и ещё {len(errors) - IMPORT_MAX_ERRORS_SHOWN}"
+    await message.answer(report[:4096], reply_markup=ADMIN_KB)
+    await state.clear()
+
+
+@admin_router.message(ImportProducts.file)
+async def import_products_exception_error(message: types.Message, state: FSMContext):
+    """Обрабатываем неверно введенные данные"""
+    await message.answer("Отправьте файл .xlsx или .csv или напишите \"отмена\"")
+
+
+@admin_router.message(StateFilter(None), F.text == "Выгрузить товары")
+async def export_products(message: types.Message, session: AsyncSession):
+    """Выгружаем каталог в .xlsx, читая товары из БД потоково"""
+    workbook, sheet = create_products_workbook()
+    async for description, price, category, subcategory, image, quantity in orm_stream_products(session):
+        sheet.append([description, price / 100, category, subcategory, image, quantity])
+
+    file_descriptor, file_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(file_descriptor)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, workbook.save, file_path)
+        await message.answer_document(types.FSInputFile(file_path, filename='products.xlsx'))
+    finally:
+        os.remove(file_path)
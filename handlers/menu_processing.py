@@ -1,3 +1,8 @@
+import logging
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Callable, Hashable
+
 from aiogram.types import InputMediaPhoto
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -7,52 +12,139 @@ from buttons.inline_buttons import (
     get_user_catalog_buttons,
     get_user_main_buttons, get_user_precart, get_questions_buttons,
 )
-from database.orm_queries import Paginator
+from database.cache import menu_cache
+from database.orm_queries import Paginator, QueryPaginator
 from database.orm_queries import (
     orm_delete_from_cart,
     orm_get_banner,
     orm_get_categories,
-    orm_get_products,
-    orm_get_user_carts,
-    orm_get_subcategories, orm_get_product, orm_get_questions,
+    orm_get_products_page,
+    orm_get_user_carts_page,
+    orm_get_subcategories, orm_get_product_view, orm_get_questions_page,
 )
+from telegram_api.media import media_storage
 
+logger = logging.getLogger(__name__)
 
-async def main_menu(session: AsyncSession, level: int, menu_name: str):
-    """Создаём главное меню"""
-    banner = await orm_get_banner(session, menu_name)
-    image = InputMediaPhoto(media=banner.image, caption=banner.description)
 
-    keyboard = get_user_main_buttons(level=level)
+@dataclass(frozen=True)
+class MenuRequest:
+    """Параметры запрошенного экрана меню (из колбека)"""
+    level: int
+    menu_name: str
+    category: int | None = None
+    page: int | None = None
+    product_id: int | None = None
+    user_id: int | None = None
 
-    return image, keyboard
 
+@dataclass(frozen=True)
+class Screen:
+    """Экран меню: какие данные ему нужны и как из них строится картинка с клавиатурой"""
+    level: int
+    name: str
+    render: Callable[[MenuRequest, dict[str, Any]], tuple[InputMediaPhoto, Any]]
+    banner: str | None = None  # Имя баннера страницы
+    needs: tuple[str, ...] = ()  # Имена загрузчиков из DEPENDENCIES
+    snapshot: Callable[[MenuRequest], Hashable] | None = None  # Ключ снимка, если экран не зависит от пользователя
+    prepare: Callable[[AsyncSession, MenuRequest], Awaitable[MenuRequest]] | None = None  # Действие до загрузки
 
-async def catalog(session: AsyncSession, level: int, menu_name: str):
-    """Создаём каталог"""
-    banner = await orm_get_banner(session, menu_name)
-    image = InputMediaPhoto(media=banner.image, caption=banner.description)
 
-    categories = await orm_get_categories(session)
+DEPENDENCIES: dict[str, Callable[[AsyncSession, MenuRequest], Awaitable[Any]]] = {}
+SCREENS: dict[int, Screen] = {}
 
-    keyboard = get_user_catalog_buttons(level=level, categories=categories)
 
-    return image, keyboard
+def dependency(name: str):
+    """Регистрируем загрузчик данных, на который экраны ссылаются по имени"""
+    def decorator(loader):
+        DEPENDENCIES[name] = loader
+        return loader
+    return decorator
 
 
-async def subcatalog(session: AsyncSession, level: int, category: int, menu_name: str):
-    """Создаём подкаталог (с подкатегориями)"""
-    banner = await orm_get_banner(session, menu_name)
-    image = InputMediaPhoto(media=banner.image, caption=banner.description)
+def register_screen(level: int, name: str, **options):
+    """Регистрируем функцию построения экрана для уровня меню level"""
+    def decorator(render):
+        SCREENS[level] = Screen(level=level, name=name, render=render, **options)
+        return render
+    return decorator
 
-    categories = await orm_get_subcategories(session, category_id=category)
 
-    keyboard = get_user_catalog_buttons(level=level, categories=categories)
+class ScreenTimings:
+    """Время построения каждого экрана (вместе с выдачей готовых снимков)"""
 
-    return image, keyboard
+    def __init__(self):
+        self._timings: dict[str, list[float]] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        """Учитываем одно построение экрана"""
+        timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+    def stats(self) -> dict:
+        """Количество, среднее и максимальное время по экранам"""
+        return {
+            name: {'renders': renders, 'avg_ms': total / renders * 1000, 'max_ms': slowest * 1000}
+            for name, (renders, total, slowest) in self._timings.items()
+        }
+
+
+screen_timings = ScreenTimings()
+
+
+@dependency('categories')
+async def load_categories(session: AsyncSession, request: MenuRequest):
+    """Категории каталога"""
+    return await orm_get_categories(session)
+
+
+@dependency('subcategories')
+async def load_subcategories(session: AsyncSession, request: MenuRequest):
+    """Подкатегории выбранной категории"""
+    return await orm_get_subcategories(session, category_id=request.category)
+
+
+@dependency('products_page')
+async def load_products_page(session: AsyncSession, request: MenuRequest):
+    """Страница товаров подкатегории"""
+    return await orm_get_products_page(session, subcategory_id=request.category, page=request.page)
+
+
+@dependency('product')
+async def load_product(session: AsyncSession, request: MenuRequest):
+    """Карточка товара"""
+    return await orm_get_product_view(session, request.product_id)
 
 
-def pages(paginator: Paginator):
+@dependency('questions_page')
+async def load_questions_page(session: AsyncSession, request: MenuRequest):
+    """Страница FAQ"""
+    return await orm_get_questions_page(session, page=request.page)
+
+
+@dependency('cart_page')
+async def load_cart_page(session: AsyncSession, request: MenuRequest):
+    """Страница корзины пользователя"""
+    return await orm_get_user_carts_page(session, request.user_id, page=request.page)
+
+
+def banner_photo(banner, caption: str | None = None) -> InputMediaPhoto:
+    """Фото баннера с подписью; если баннера или его картинки ещё нет - заглушка"""
+    if caption is None:
+        caption = banner.description if banner else None
+    return InputMediaPhoto(media=banner.image if banner and banner.image else media_storage.placeholder,
+                           caption=caption)
+
+
+def is_cacheable(content: tuple) -> bool:
+    """Экран можно кэшировать, только если картинка уже загружена в Telegram (file_id, а не байты)"""
+    media, _ = content
+    return isinstance(media.media, str)
+
+
+def pages(paginator: Paginator | QueryPaginator):
     """Выводим функционал переключения страниц в пагинации"""
     buttons = dict()
     if paginator.has_previous():
@@ -64,103 +156,103 @@ def pages(paginator: Paginator):
     return buttons
 
 
-async def get_all_products(session: AsyncSession, level: int, subcategory: int, page: int):
-    """Выводим все товары"""
-    products = await orm_get_products(session, subcategory_id=subcategory)
+def change_quantity(menu_name: str, quantity: int) -> int:
+    """Изменяем количество товара по нажатой кнопке (не меньше одного)"""
+    if menu_name == "decrement":
+        return max(quantity - 1, 1)
+    if menu_name == "increment":
+        return quantity + 1
+    return quantity
 
-    paginator = Paginator(products, page=page)
-    product = paginator.get_page()[0]
 
-    image = InputMediaPhoto(
-        media=product.image,
-        caption=f"{product.description}\n"
-                f"<strong>Товар {paginator.page} из {paginator.pages}</strong>",
-    )
+@register_screen(0, 'main', banner='main', snapshot=lambda request: (0,))
+def main_menu(request: MenuRequest, data: dict):
+    """Создаём главное меню"""
+    return banner_photo(data['banner']), get_user_main_buttons(level=request.level)
 
-    pagination_buttons = pages(paginator)
 
-    keyboard = get_products_buttons(
-        level=level,
-        category=subcategory,
-        page=page,
-        pagination_buttons=pagination_buttons,
-        product_id=product.id,
-    )
+@register_screen(1, 'catalog', banner='catalog', needs=('categories',), snapshot=lambda request: (1,))
+def catalog(request: MenuRequest, data: dict):
+    """Создаём каталог"""
+    keyboard = get_user_catalog_buttons(level=request.level, categories=data['categories'])
+    return banner_photo(data['banner']), keyboard
 
-    return image, keyboard
+
+@register_screen(2, 'subcatalog', banner='subcatalog', needs=('subcategories',),
+                 snapshot=lambda request: (2, request.category))
+def subcatalog(request: MenuRequest, data: dict):
+    """Создаём подкаталог (с подкатегориями)"""
+    keyboard = get_user_catalog_buttons(level=request.level, categories=data['subcategories'])
+    return banner_photo(data['banner']), keyboard
 
 
-async def get_all_questions(session: AsyncSession, level: int, page: int):
-    """Выводим все вопросы (FAQ)"""
-    questions = await orm_get_questions(session)
-    banner = (await orm_get_banner(session, page='faq'))
-    paginator = Paginator(questions, page=page)
-    question = paginator.get_page()[0]
+@register_screen(3, 'products', needs=('products_page',))
+def get_all_products(request: MenuRequest, data: dict):
+    """Выводим все товары"""
+    paginator = data['products_page']
+    product = paginator.get_page()[0]
 
     image = InputMediaPhoto(
-        media=banner.image,
-        caption=f"Вопрос: {question.question}\nОтвет: {question.answer}",
+        media=product.image,
+        caption=f"{product.description}\n"
+                f"Цена: {product.price / 100:.2f} ₽\n"
+                f"<strong>Товар {paginator.page} из {paginator.pages}</strong>",
     )
 
-    pagination_buttons = pages(paginator)
-
-    keyboard = get_questions_buttons(
-        level=level,
-        page=page,
-        pagination_buttons=pagination_buttons,
+    keyboard = get_products_buttons(
+        level=request.level,
+        category=request.category,
+        page=paginator.page,
+        pagination_buttons=pages(paginator),
+        product_id=product.id,
     )
 
     return image, keyboard
 
 
-async def precart(session: AsyncSession, level: int, menu_name: str, page: int, product_id: int):
+@register_screen(4, 'precart', needs=('product',))
+def precart(request: MenuRequest, data: dict):
     """Выводим добавление товара в корзину (изменение количества и подтверждение)"""
-    product = (await orm_get_product(session, product_id))
-    if menu_name == "decrement":
-        if product.quantity > 1 or page > 1:
-            page -= 1
-        else:
-            page = 0
-    elif menu_name == "increment":
-        page += 1
+    product = data['product']
+    page = change_quantity(request.menu_name, request.page)
 
     image = InputMediaPhoto(
         media=product.image,
         caption=f"{product.description}\nКоличество: {page}"
     )
     keyboard = get_user_precart(
-        level=level,
+        level=request.level,
         page=page,
-        product_id=product_id,
+        product_id=request.product_id,
     )
 
     return image, keyboard
 
 
-async def get_cart(session: AsyncSession, level: int, menu_name: str, page: int, user_id: int, product_id: int):
-    """Создаем корзину для пользователя"""
-    if menu_name == "delete":
-        await orm_delete_from_cart(session, user_id, product_id)
-        if page > 1:
-            page -= 1
+async def delete_from_cart(session: AsyncSession, request: MenuRequest) -> MenuRequest:
+    """Удаляем товар из корзины до загрузки её страницы"""
+    if request.menu_name != "delete":
+        return request
+    await orm_delete_from_cart(session, request.user_id, request.product_id)
+    return replace(request, page=request.page - 1) if request.page > 1 else request
 
-    carts = await orm_get_user_carts(session, user_id)
 
-    if not carts:
-        banner = await orm_get_banner(session, "cart")
-        image = InputMediaPhoto(
-            media=banner.image, caption=f"<strong>{banner.description}</strong>"
-        )
+@register_screen(5, 'cart', banner='cart', needs=('cart_page',), prepare=delete_from_cart)
+def get_cart(request: MenuRequest, data: dict):
+    """Создаем корзину для пользователя"""
+    paginator = data['cart_page']
+
+    if not paginator.get_page():
+        banner = data['banner']
+        image = banner_photo(banner, caption=f"<strong>{banner.description if banner else ''}</strong>")
 
         keyboard = get_user_cart(
-            level=level,
+            level=request.level,
             page=None,
             pagination_buttons=None,
             product_id=None,
         )
     else:
-        paginator = Paginator(carts, page=page)
-
         cart = paginator.get_page()[0]
 
         image = InputMediaPhoto(
@@ -169,18 +261,72 @@ async def get_cart(session: AsyncSession, level: int, menu_name: str, page: int,
                     f"\nТовар {paginator.page} из {paginator.pages} в корзине."
         )
 
-        pagination_buttons = pages(paginator)
-
         keyboard = get_user_cart(
-            level=level,
-            page=page,
-            pagination_buttons=pagination_buttons,
+            level=request.level,
+            page=paginator.page,
+            pagination_buttons=pages(paginator),
             product_id=cart.product.id,
         )
 
     return image, keyboard
 
 
+@register_screen(6, 'faq', banner='faq', needs=('questions_page',), snapshot=lambda request: (6, request.page))
+def get_all_questions(request: MenuRequest, data: dict):
+    """Выводим все вопросы (FAQ)"""
+    paginator = data['questions_page']
+    question = paginator.get_page()[0]
+
+    image = banner_photo(data['banner'], caption=f"Вопрос: {question.question}\nОтвет: {question.answer}")
+
+    keyboard = get_questions_buttons(
+        level=request.level,
+        page=paginator.page,
+        pagination_buttons=pages(paginator),
+    )
+
+    return image, keyboard
+
+
+async def render_screen(session: AsyncSession, request: MenuRequest):
+    """Загружаем все данные экрана за один проход и строим его
+
+    Загрузчики идут по очереди: одну AsyncSession нельзя использовать из нескольких корутин сразу.
+    Баннеры, каталог и карточки товаров берутся из кэша, так что запросы в БД делают только данные пользователя.
+    """
+    screen = SCREENS.get(request.level)
+    if screen is None:
+        raise ValueError(f"Unknown menu level {request.level}")
+    if screen.prepare:
+        request = await screen.prepare(session, request)
+
+    data = {}
+    if screen.banner:
+        data['banner'] = await orm_get_banner(session, screen.banner)
+    for name in screen.needs:
+        data[name] = await DEPENDENCIES[name](session, request)
+    return screen.render(request, data)
+
+
+async def build_menu_snapshots(session: AsyncSession):
+    """Предрассчитываем все статичные экраны: главное меню, каталог, подкаталоги и страницы FAQ"""
+    menu_cache.invalidate()
+    requests = [MenuRequest(0, 'main'), MenuRequest(1, 'catalog')]
+    requests += [MenuRequest(2, 'category', category=category.id) for category in await orm_get_categories(session)]
+    requests += [MenuRequest(6, 'faq', page=page)
+                 for page in range(1, (await orm_get_questions_page(session)).pages + 1)]
+
+    for request in requests:
+        key = SCREENS[request.level].snapshot(request)
+        try:
+            content = await render_screen(session, request)
+        except (AttributeError, IndexError, ValueError) as e:  # Например, ещё нет ни одного вопроса
+            logger.warning("Menu screen %s is not prebuilt: %s", key, e)
+            continue
+        if is_cacheable(content):
+            menu_cache.set(key, content)
+
+
 async def get_menu_content(
         session: AsyncSession,
         level: int,
@@ -190,18 +336,28 @@ async def get_menu_content(
         product_id: int | None = None,
         user_id: int | None = None,
 ):
-    """Объединяем все функции выше и выводим их в соответствии с их уровнем"""
-    if level == 0:
-        return await main_menu(session, level, menu_name)
-    elif level == 1:
-        return await catalog(session, level, menu_name)
-    elif level == 2:
-        return await subcatalog(session, level, category, menu_name)
-    elif level == 3:
-        return await get_all_products(session, level, category, page)
-    elif level == 4:
-        return await precart(session, level, menu_name, page, product_id)
-    elif level == 5:
-        return await get_cart(session, level, menu_name, page, user_id, product_id)
-    elif level == 6:
-        return await get_all_questions(session, level, page)
+    """Выводим экран меню по его уровню: статичные экраны - из снимков, остальные строим, замеряя время"""
+    request = MenuRequest(level, menu_name, category, page, product_id, user_id)
+    screen = SCREENS.get(level)
+    if screen is None:
+        raise ValueError(f"Unknown menu level {level}")
+
+    start = time.perf_counter()
+    try:
+        key = screen.snapshot(request) if screen.snapshot else None
+        if key is None:
+            return await render_screen(session, request)
+        content = menu_cache.get(key)
+        if content is None:
+            content = await render_screen(session, request)
+            if is_cacheable(content):
+                menu_cache.set(key, content)
+        return content
+    finally:
+        screen_timings.record(screen.name, time.perf_counter() - start)
+
+
+async def get_static_content(session: AsyncSession, level: int, menu_name: str, category: int | None,
+                             page: int | None):
+    """Строим статичный экран заново, минуя снимки"""
+    return await render_screen(session, MenuRequest(level, menu_name, category, page))
@@ -1,24 +1,47 @@
+import asyncio
+import logging
 import os
+from dataclasses import dataclass, field
 
 from aiogram import F, types, Router, Bot
-from aiogram.filters import CommandStart
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import PreCheckoutQuery, LabeledPrice
 from dotenv import load_dotenv, find_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from buttons.inline_buttons import MenuCallBack
+from buttons.inline_buttons import MenuCallBack, get_callback_buttons
 from database.orm_queries import (
     orm_add_to_cart,
-    orm_add_user, orm_get_product,
+    ORDER_STOCK_SHORTAGE, orm_add_user, orm_create_order, orm_get_cart_invoice, orm_check_cart, orm_search_products,
 )
-from excel.excel_functional import add_row_to_excel
-from handlers.menu_processing import get_menu_content
+from excel.excel_functional import order_exporter
+from filters.chat_types import invalidate_membership
+from handlers.menu_processing import change_quantity, get_menu_content
 
 load_dotenv(find_dotenv())
 
+logger = logging.getLogger(__name__)
+
 user_private_router = Router()
 
+SEARCH_PAGE_SIZE = 10
+
+PRECART_DEBOUNCE = float(os.getenv('PRECART_DEBOUNCE', 0.3))  # Сколько ждём следующего нажатия +1/-1 (секунды)
+
+
+@dataclass
+class PendingQuantity:
+    """Нажатия +1/-1 по одному сообщению, пока его редактирование не завершено"""
+    click: int  # Номер последнего нажатия
+    quantity: int  # Накопленное количество
+    shown: int  # Количество на экране
+    editing: asyncio.Lock = field(default_factory=asyncio.Lock)  # Сообщение редактируется одним вызовом за раз
+
+
+pending_quantities: dict[tuple[int, int], PendingQuantity] = {}  # (chat_id, message_id) -> нажатия
+
 
 class AddShippingInfoToCart(StatesGroup):
     city = State()
@@ -34,6 +57,53 @@ async def start_command(message: types.Message, session: AsyncSession):
     await message.answer_photo(media.media, caption=media.caption, reply_markup=reply_markup)
 
 
+@user_private_router.message(Command("search"))
+async def search_command(message: types.Message, command: CommandObject, session: AsyncSession):
+    """Ищем товары по описанию и выводим кнопки с найденными товарами"""
+    if not command.args:
+        await message.answer("Напишите, что найти, например: /search смартфон")
+        return
+
+    products = await orm_search_products(session, command.args, limit=SEARCH_PAGE_SIZE)
+    if not products:
+        await message.answer("Ничего не найдено.")
+        return
+    buttons = {f"{number}. {product.description[:40]} - {product.price / 100:.2f} ₽": f"search_{product.id}"
+               for number, product in enumerate(products, start=1)}
+    keyboard = get_callback_buttons(buttons=buttons, sizes=(1,))
+    await message.answer(f"Найдено по запросу «{command.args}»:", reply_markup=keyboard)
+
+
+@user_private_router.callback_query(F.data.startswith('search_'))
+async def search_result(callback: types.CallbackQuery, session: AsyncSession):
+    """Открываем найденный товар с выбором количества"""
+    media, reply_markup = await get_menu_content(session, level=4, menu_name='precart', page=1,
+                                                 product_id=int(callback.data.split('_')[-1]))
+    await callback.message.answer_photo(media.media, caption=media.caption, reply_markup=reply_markup)
+    await callback.answer()
+
+
+@user_private_router.inline_query()
+async def search_inline(inline_query: types.InlineQuery, session: AsyncSession):
+    """Ищем товары в inline-режиме (@бот запрос), подгружая результаты страницами"""
+    offset = int(inline_query.offset or 0)
+    products = await orm_search_products(session, inline_query.query, offset=offset, limit=SEARCH_PAGE_SIZE) \
+        if inline_query.query.strip() else []
+    results = [
+        types.InlineQueryResultCachedPhoto(
+            id=str(product.id),
+            photo_file_id=product.image,
+            caption=f"{product.description}\nЦена: {product.price / 100:.2f} ₽",
+            reply_markup=get_callback_buttons(buttons={
+                "Купить": MenuCallBack(level=4, menu_name='precart', product_id=product.id).pack(),
+            }),
+        )
+        for product in products
+    ]
+    next_offset = str(offset + SEARCH_PAGE_SIZE) if len(products) == SEARCH_PAGE_SIZE else ''
+    await inline_query.answer(results, next_offset=next_offset, cache_time=60, is_personal=False)
+
+
 async def add_to_cart(callback: types.CallbackQuery, callback_data: MenuCallBack, session: AsyncSession):
     """Добавляем товар в корзину"""
     user = callback.from_user
@@ -49,44 +119,161 @@ async def add_to_cart(callback: types.CallbackQuery, callback_data: MenuCallBack
     await callback.answer("Товар добавлен в корзину!")
 
 
+@user_private_router.chat_member(flags={'db': False})
+async def chat_member_changed(event: types.ChatMemberUpdated):
+    """Сбрасываем кэш подписки, когда пользователь вступает в группу/канал или покидает их"""
+    invalidate_membership(event.new_chat_member.user.id)
+
+
 @user_private_router.callback_query(F.data.startswith('order_'))
 async def create_order(callback: types.CallbackQuery, session: AsyncSession):
-    """Создаём заказ и отправляем пользователю чек на оплату"""
+    """Создаём заказ из всей корзины и отправляем пользователю чек на оплату"""
     user = callback.from_user
-    product_id = callback.data.split("_")[-1]
-    product = (await orm_get_product(session, int(product_id)))
+    lines = await orm_get_cart_invoice(session, user.id)
+    if not lines:
+        await callback.answer("Корзина пуста!")
+        return
+    if any(line.amount <= 0 for line in lines):  # Товары, добавленные до появления цен, оплатить нельзя
+        await callback.answer("В корзине есть товары без цены, удалите их, чтобы оформить заказ.", show_alert=True)
+        return
 
     await callback.bot.send_invoice(
         chat_id=user.id,
-        title=product.description,
-        description=product.description,
-        payload=str(product.id),
+        title='Заказ',
+        description='\n'.join(f"{line.description} x {line.quantity}" for line in lines)[:255],
+        payload=str(lines[0].total),
         provider_token=os.getenv('PROVIDER_TOKEN'),
         currency='RUB',
         start_parameter='test_bot',
         prices=[
-            LabeledPrice(label='Товар 1', amount=55555),
-            LabeledPrice(label='Товар 2', amount=11111),
-            LabeledPrice(label='Товар 3', amount=22222)
+            LabeledPrice(label=f"{line.description[:28]} x {line.quantity}", amount=line.amount) for line in lines
         ],
         need_shipping_address=True,
     )
+    await callback.answer()
 
 
 @user_private_router.pre_checkout_query()
-async def pre_checkout(pre_checkout_query: PreCheckoutQuery, bot: Bot):
-    """Обрабатываем событие pre_checkout и отвечаем пользователю"""
-    await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True)
+async def pre_checkout(pre_checkout_query: PreCheckoutQuery, bot: Bot, session: AsyncSession):
+    """Перепроверяем сумму корзины и остатки перед оплатой и отвечаем пользователю"""
+    total, out_of_stock = await orm_check_cart(session, pre_checkout_query.from_user.id)
+    if out_of_stock:
+        await bot.answer_pre_checkout_query(
+            pre_checkout_query.id, ok=False,
+            error_message="Некоторых товаров из корзины нет в нужном количестве или у них нет цены.",
+        )
+    elif total != pre_checkout_query.total_amount:
+        await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False,
+                                            error_message="Корзина изменилась, оформите заказ заново.")
+    else:
+        await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True)
 
 
 @user_private_router.message(F.successful_payment)
-async def successful_payment():
-    """Добавляем тестовые данные о заказе в таблицу"""
-    file_path = './orders.xlsx'
-    sheet_name = 'Orders'
-    new_row = ['Тестовые данные', 'Тестовые данные', 'Тестовые данные']
+async def successful_payment(message: types.Message, session: AsyncSession):
+    """Сохраняем заказ из корзины и добавляем его в очередь выгрузки в таблицу"""
+    payment = message.successful_payment
+    order_info = payment.order_info
+    shipping_address = order_info.shipping_address if order_info else None
+
+    user = message.from_user
+    await orm_add_user(session, user_id=user.id, first_name=user.first_name, last_name=user.last_name)
+    order = await orm_create_order(session, user_id=user.id, data={
+        'total_amount': payment.total_amount,
+        'currency': payment.currency,
+        'name': order_info.name if order_info else None,
+        'phone': order_info.phone_number if order_info else None,
+        'country_code': shipping_address.country_code if shipping_address else None,
+        'city': shipping_address.city if shipping_address else None,
+        'address': ', '.join(filter(None, [shipping_address.street_line1, shipping_address.street_line2]))
+        if shipping_address else None,
+        'post_code': shipping_address.post_code if shipping_address else None,
+        'telegram_payment_charge_id': payment.telegram_payment_charge_id,
+        'provider_payment_charge_id': payment.provider_payment_charge_id,
+    })
+
+    order_exporter.put([order.id, user.id, order.total_amount / 100, order.currency, order.city, order.address,
+                        order.telegram_payment_charge_id])
+    if order.status == ORDER_STOCK_SHORTAGE:
+        logger.warning("Order %s is paid but stock ran out, manual handling needed", order.id)
+        await message.answer(f"Спасибо! Заказ №{order.id} оплачен, но часть товаров уже закончилась. "
+                             f"Мы свяжемся с вами, чтобы заменить их или вернуть деньги.")
+        return
+    await message.answer(f"Спасибо! Заказ №{order.id} оплачен.")
+
+
+NAVIGATION_MENUS = ("main", "catalog", "subcatalog", "category", "cart", "faq", "precart", "next", "previous")
+
+
+def is_navigation_click(callback: types.CallbackQuery) -> bool:
+    """Переход по меню: если пользователь успел нажать дальше, такое нажатие можно не обрабатывать"""
+    try:
+        return MenuCallBack.unpack(callback.data).menu_name in NAVIGATION_MENUS
+    except (TypeError, ValueError):
+        return False
+
+
+def is_quantity_click(callback: types.CallbackQuery) -> bool:
+    """Нажатие +1/-1: такие колбеки накапливаются, а не заменяют друг друга"""
+    try:
+        return MenuCallBack.unpack(callback.data).menu_name in ("increment", "decrement")
+    except (TypeError, ValueError):
+        return False
 
-    add_row_to_excel(file_path, sheet_name, new_row)
+
+async def edit_menu_message(callback: types.CallbackQuery, media: types.InputMediaPhoto, reply_markup):
+    """Редактируем сообщение меню, не считая ошибкой отсутствие изменений"""
+    try:
+        await callback.message.edit_media(media=media, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if 'message is not modified' not in e.message:
+            raise
+
+
+async def open_in_private_chat(callback: types.CallbackQuery, media: types.InputMediaPhoto, reply_markup):
+    """Отправляем экран меню в личный чат с ботом (если пользователь уже запускал бота)"""
+    try:
+        await callback.bot.send_photo(callback.from_user.id, media.media, caption=media.caption,
+                                      reply_markup=reply_markup)
+    except TelegramForbiddenError:
+        await callback.answer("Откройте чат с ботом и нажмите /start, затем нажмите «Купить» ещё раз.",
+                              show_alert=True)
+        return
+    await callback.answer("Товар открыт в чате с ботом")
+
+
+async def change_precart_quantity(callback: types.CallbackQuery, callback_data: MenuCallBack, session: AsyncSession):
+    """Копим быстрые нажатия +1/-1 и редактируем сообщение один раз, уже с итоговым количеством"""
+    key = (callback.message.chat.id, callback.message.message_id)
+    pending = pending_quantities.get(key)
+    if pending is None:
+        pending = pending_quantities[key] = PendingQuantity(0, callback_data.page, callback_data.page)
+    pending.click += 1
+    click = pending.click
+    pending.quantity = change_quantity(callback_data.menu_name, pending.quantity)
+    await callback.answer()
+
+    await asyncio.sleep(PRECART_DEBOUNCE)
+    if pending.click != click:
+        return  # Было более позднее нажатие, сообщение отредактирует оно
+    async with pending.editing:
+        try:
+            quantity = pending.quantity
+            if quantity == pending.shown:
+                return
+            media, reply_markup = await get_menu_content(
+                session,
+                level=callback_data.level,
+                menu_name='precart',
+                page=quantity,
+                product_id=callback_data.product_id,
+            )
+            await edit_menu_message(callback, media, reply_markup)
+            pending.shown = quantity
+        finally:
+            # Пока идёт редактирование, кнопки на экране устарели - новые нажатия считаются от pending
+            if pending.click == click and pending_quantities.get(key) is pending:
+                del pending_quantities[key]
 
 
 @user_private_router.callback_query(MenuCallBack.filter())
@@ -96,6 +283,9 @@ async def user_menu(callback: types.CallbackQuery, callback_data: MenuCallBack,
     if callback_data.menu_name == "add_to_cart":
         await add_to_cart(callback, callback_data, session)
         return
+    if callback_data.menu_name in ("increment", "decrement"):
+        await change_precart_quantity(callback, callback_data, session)
+        return
 
     media, reply_markup = await get_menu_content(
         session,
@@ -107,5 +297,8 @@ async def user_menu(callback: types.CallbackQuery, callback_data: MenuCallBack,
         user_id=callback.from_user.id,
     )
 
-    await callback.message.edit_media(media=media, reply_markup=reply_markup)
+    if callback.message is None:  # Кнопка под результатом inline-поиска: такое сообщение не меню бота
+        await open_in_private_chat(callback, media, reply_markup)
+        return
+    await edit_menu_message(callback, media, reply_markup)
     await callback.answer()
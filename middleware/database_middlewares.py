@@ -1,15 +1,58 @@
+import logging
 from typing import Any, Awaitable, Callable, Dict
 
-from aiogram import BaseMiddleware
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.instrumentation import QueryBudgetExceeded, count_queries
+
+logger = logging.getLogger(__name__)
+
+
+class LazySession:
+    """Прокси AsyncSession: сессия (и соединение из пула) создаётся только при первом обращении"""
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self._session_pool = session_pool
+        self._session: AsyncSession | None = None
+
+    @property
+    def used(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_pool()
+        return getattr(self._session, name)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
 
 
 class DataBaseSession(BaseMiddleware):
-    """Middleware для работы с БД"""
+    """Middleware для работы с БД
+
+    Обработчик может отказаться от сессии флагом flags={'db': False}
+    (флаги доступны, когда middleware подключён к событиям роутера через setup).
+    """
 
     def __init__(self, session_pool: async_sessionmaker):
         self.session_pool = session_pool
+        self.updates = 0
+        self.db_updates = 0
+
+    def setup(self, router: Router) -> None:
+        """Подключаем middleware к событиям роутера, которым нужна БД"""
+        for observer in (router.message, router.callback_query, router.pre_checkout_query, router.chat_member,
+                         router.inline_query):
+            observer.middleware(self)
+
+    def stats(self) -> dict:
+        """Сколько апдейтов обработано и сколько из них обращались к БД"""
+        return {'updates': self.updates, 'db_updates': self.db_updates}
 
     async def __call__(
             self,
@@ -17,6 +60,41 @@ class DataBaseSession(BaseMiddleware):
             event: TelegramObject,
             data: Dict[str, Any],
     ) -> Any:
-        async with self.session_pool() as session:
-            data['session'] = session
+        self.updates += 1
+        if get_flag(data, 'db') is False:
             return await handler(event, data)
+
+        session = LazySession(self.session_pool)
+        data['session'] = session
+        try:
+            return await handler(event, data)
+        finally:
+            if session.used:
+                self.db_updates += 1
+            await session.close()
+
+
+class QueryBudget(BaseMiddleware):
+    """Middleware, считающий SQL запросы и время в БД на каждый апдейт и проверяющий бюджет запросов"""
+
+    def __init__(self, budget: int, strict: bool = False):
+        self.budget = budget
+        self.strict = strict
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        with count_queries() as stats:
+            result = await handler(event, data)
+
+        update_id = getattr(event, 'update_id', None)
+        logger.debug("Update %s: %d SQL queries, %.1f ms in DB", update_id, stats.count, stats.duration * 1000)
+        if stats.count > self.budget:
+            message = f"Update {update_id}: {stats.count} SQL queries exceed budget of {self.budget}"
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning("%s:\n%s", message, '\n'.join(stats.statements))
+        return result
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+
+class MemoryTokenBucket:
+    """Token bucket в памяти процесса: rate токенов в секунду, не больше burst про запас"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: dict[Any, tuple[float, float]] = {}
+
+    async def consume(self, key: Any) -> bool:
+        """Забираем токен; False, если лимит исчерпан"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        if len(self._buckets) >= self.max_keys and key not in self._buckets:
+            self._buckets.clear()  # Простая защита от разрастания: полные вёдра восстановятся сами
+        self._buckets[key] = (tokens, now)
+        return allowed
+
+
+class RedisTokenBucket:
+    """Token bucket в Redis, общий для всех процессов бота (требует пакет redis)"""
+
+    SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+    local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or ARGV[3])
+    tokens = math.min(tonumber(ARGV[2]), tokens + (tonumber(ARGV[3]) - updated) * tonumber(ARGV[1]))
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2]) / tonumber(ARGV[1])) + 1)
+    return allowed
+    """
+
+    def __init__(self, redis, rate: float, burst: int, prefix: str = 'throttle'):
+        self.redis = redis
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._script = redis.register_script(self.SCRIPT)
+
+    async def consume(self, key: Any) -> bool:
+        """Забираем токен атомарно скриптом на стороне Redis"""
+        allowed = await self._script(keys=[f'{self.prefix}:{key}'], args=[self.rate, self.burst, time.time()])
+        return bool(allowed)
+
+
+def get_token_bucket(env_prefix: str = 'THROTTLE', rate: float = 3, burst: int = 5):
+    """Выбираем хранилище лимитов по переменной окружения THROTTLE_BACKEND (memory или redis)
+
+    Лимиты берутся из {env_prefix}_RATE и {env_prefix}_BURST, по умолчанию - rate и burst.
+    """
+    rate = float(os.getenv(f'{env_prefix}_RATE', rate))
+    burst = int(os.getenv(f'{env_prefix}_BURST', burst))
+    if os.getenv('THROTTLE_BACKEND', 'memory') == 'redis':
+        from redis.asyncio import Redis  # Требует пакет redis
+
+        return RedisTokenBucket(Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')), rate, burst,
+                                prefix=env_prefix.lower())
+    return MemoryTokenBucket(rate, burst)
+
+
+class CallbackThrottling(BaseMiddleware):
+    """Ограничиваем частоту колбеков пользователя и отбрасываем устаревшие нажатия в одном сообщении
+
+    Пока обрабатывается колбек сообщения, новые колбеки того же сообщения ждут по очереди. Из ждущих колбеков,
+    для которых supersede возвращает True (переходы по меню), выполняется только последний, остальным сразу
+    отвечаем без обработки; прочие колбеки (например, добавление в корзину) выполняются все. Колбеки, для которых
+    keep_all возвращает True (например, накопительные +1/-1), не ждут и не отбрасываются и расходуют отдельный,
+    более щедрый лимит keep_all_bucket (без него - не ограничиваются): обработчик сам склеивает быстрые нажатия.
+    """
+
+    def __init__(self, bucket, keep_all: Callable[[CallbackQuery], bool] = lambda callback: False,
+                 keep_all_bucket=None, supersede: Callable[[CallbackQuery], bool] = lambda callback: True):
+        self.bucket = bucket
+        self.keep_all = keep_all
+        self.supersede = supersede
+        self.keep_all_bucket = keep_all_bucket
+        self.throttled = 0
+        self.superseded = 0
+        self._counter = count()
+        self._latest: dict[tuple[int, int], int] = {}
+        self._locks: dict[tuple[int, int], tuple[asyncio.Lock, int]] = {}
+
+    def stats(self) -> dict:
+        """Сколько колбеков отброшено по лимиту и как устаревшие"""
+        return {'throttled': self.throttled, 'superseded': self.superseded}
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: CallbackQuery,
+            data: Dict[str, Any],
+    ) -> Any:
+        keep_all = self.keep_all(event)
+        bucket = self.keep_all_bucket if keep_all else self.bucket
+        if bucket is not None and not await bucket.consume(event.from_user.id):
+            self.throttled += 1
+            await event.answer('Слишком часто, подождите секунду')
+            return None
+
+        if event.message is None or keep_all:
+            return await handler(event, data)
+
+        key = (event.message.chat.id, event.message.message_id)
+        supersede = self.supersede(event)
+        if supersede:
+            number = next(self._counter)
+            self._latest[key] = number
+        lock, waiters = self._locks.get(key, (asyncio.Lock(), 0))
+        self._locks[key] = (lock, waiters + 1)
+        try:
+            async with lock:
+                if supersede and self._latest.get(key) != number:
+                    self.superseded += 1
+                    await event.answer()
+                    return None
+                return await handler(event, data)
+        finally:
+            lock, waiters = self._locks[key]
+            if waiters == 1:
+                del self._locks[key]
+                self._latest.pop(key, None)
+            else:
+                self._locks[key] = (lock, waiters - 1)
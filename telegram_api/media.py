@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+import zlib
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import BufferedInputFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_queries import orm_add_media_file, orm_change_banner_image, orm_get_info_pages, orm_get_media_file_id
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def placeholder_png(width: int = 640, height: int = 360, color: tuple[int, int, int] = (43, 43, 43)) -> bytes:
+    """Собираем однотонную PNG-заглушку без сторонних библиотек"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    row = b'\x00' + bytes(color) * width  # Фильтр строки 0 и пиксели RGB
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(row * height, 9))
+        + chunk(b'IEND', b'')
+    )
+
+
+class MediaStorage:
+    """Загружаем локальные картинки в Telegram один раз и переиспользуем их file_id
+
+    file_id хранятся в БД по sha256 содержимого и id бота (file_id действителен только для загрузившего его бота),
+    поэтому одинаковые файлы загружаются один раз, а общая БД обслуживает несколько ботов и окружений.
+    Для загрузки бот отправляет фото в служебный чат MEDIA_CHAT_ID и сразу удаляет сообщение.
+    """
+
+    def __init__(self, chat_id: int | str | None, media_dir: str, placeholder_path: str | None = None):
+        self.chat_id = chat_id
+        self.media_dir = Path(media_dir)
+        self.placeholder_path = placeholder_path
+        self.placeholder_id: str | None = None
+        self.uploads = 0
+        self.hits = 0
+        self._file_ids: dict[tuple[str, int], str] = {}
+
+    def stats(self) -> dict:
+        """Сколько картинок загружено и сколько раз обошлись уже известным file_id"""
+        return {'uploads': self.uploads, 'hits': self.hits, 'placeholder_ready': self.placeholder_id is not None}
+
+    @property
+    def placeholder(self) -> str | BufferedInputFile:
+        """Заглушка для экранов без картинки: file_id после прогрева, до него - сами байты (такие экраны не кэшируем)"""
+        if self.placeholder_id:
+            return self.placeholder_id
+        return BufferedInputFile(self._placeholder_bytes(), filename='placeholder.png')
+
+    def _placeholder_bytes(self) -> bytes:
+        """Своя заглушка из MEDIA_PLACEHOLDER или сгенерированная"""
+        if self.placeholder_path:
+            return Path(self.placeholder_path).read_bytes()
+        return placeholder_png()
+
+    def local_path(self, name: str) -> Path | None:
+        """Путь к картинке внутри MEDIA_DIR или None, если такого файла нет"""
+        root = self.media_dir.resolve()
+        path = (root / name).resolve()
+        if path.is_relative_to(root) and path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+            return path
+        return None
+
+    async def upload(self, bot: Bot, session: AsyncSession, content: bytes, filename: str) -> str:
+        """Получаем file_id картинки: из памяти, из БД или загрузкой в служебный чат"""
+        key = (hashlib.sha256(content).hexdigest(), bot.id)
+        file_id = self._file_ids.get(key) or await orm_get_media_file_id(session, *key)
+        if file_id:
+            self.hits += 1
+            self._file_ids[key] = file_id
+            return file_id
+
+        if not self.chat_id:
+            raise ValueError('не задан MEDIA_CHAT_ID для загрузки картинок')
+        message = await bot.send_photo(self.chat_id, BufferedInputFile(content, filename=filename),
+                                       disable_notification=True)
+        file_id = message.photo[-1].file_id
+        try:
+            await bot.delete_message(self.chat_id, message.message_id)
+        except TelegramAPIError:  # Сообщение в служебном чате не мешает, file_id уже получен
+            pass
+        await orm_add_media_file(session, *key, file_id)
+        self.uploads += 1
+        self._file_ids[key] = await orm_get_media_file_id(session, *key) or file_id
+        return self._file_ids[key]
+
+    async def resolve(self, bot: Bot, session: AsyncSession, image: str) -> str:
+        """Имя файла из MEDIA_DIR превращаем в file_id, остальное считаем готовым file_id"""
+        path = self.local_path(image)
+        if path is None:
+            return image
+        content = await asyncio.to_thread(path.read_bytes)
+        try:
+            return await self.upload(bot, session, content, path.name)
+        except TelegramAPIError as e:
+            raise ValueError(f"не удалось загрузить «{image}»: {e}")
+
+    async def prewarm(self, bot: Bot, session: AsyncSession):
+        """Прогреваем заглушку и баннеры: для баннеров без картинки ищем MEDIA_DIR/banners/<имя>.<jpg|png|...>
+
+        Если после прогрева у какого-то баннера нет ни картинки, ни загруженной заглушки, бот не запускается:
+        иначе каждый показ такого экрана заново отправлял бы байты заглушки в Telegram.
+        """
+        banners = await orm_get_info_pages(session)
+        without_image = [banner.name for banner in banners if not banner.image]
+        if self.chat_id:
+            try:
+                content = await asyncio.to_thread(self._placeholder_bytes)
+                self.placeholder_id = await self.upload(bot, session, content, 'placeholder.png')
+            except (OSError, TelegramAPIError) as e:
+                logger.warning("Media placeholder is not uploaded: %s", e)
+            without_image = [name for name in without_image if not await self._prewarm_banner(bot, session, name)]
+
+        if without_image and self.placeholder_id is None:
+            raise RuntimeError(f"У баннеров {', '.join(without_image)} нет картинки, а заглушка не загружена: "
+                               f"задайте MEDIA_CHAT_ID или картинки баннеров")
+
+    async def _prewarm_banner(self, bot: Bot, session: AsyncSession, name: str) -> bool:
+        """Загружаем картинку баннера из MEDIA_DIR/banners, если она там есть"""
+        path = next(filter(None, (self.local_path(f'banners/{name}{extension}') for extension in IMAGE_EXTENSIONS)),
+                    None)
+        if path is None:
+            return False
+        try:
+            file_id = await self.resolve(bot, session, str(path.relative_to(self.media_dir.resolve())))
+        except ValueError as e:
+            logger.warning("Banner %s is not uploaded: %s", name, e)
+            return False
+        await orm_change_banner_image(session, name, file_id)
+        return True
+
+media_storage = MediaStorage(
+    chat_id=os.getenv('MEDIA_CHAT_ID'),
+    media_dir=os.getenv('MEDIA_DIR', './media'),
+    placeholder_path=os.getenv('MEDIA_PLACEHOLDER'),
+)
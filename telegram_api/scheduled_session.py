@@ -0,0 +1,145 @@
+import asyncio
+import time
+from itertools import count
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    AnswerPreCheckoutQuery,
+    AnswerShippingQuery,
+    DeleteWebhook,
+    GetMe,
+    GetUpdates,
+    SendInvoice,
+    SetWebhook,
+    TelegramMethod,
+)
+
+PAYMENT_PRIORITY = 0
+CALLBACK_PRIORITY = 1
+DEFAULT_PRIORITY = 2
+
+PRIORITIES = {
+    SendInvoice: PAYMENT_PRIORITY,
+    AnswerPreCheckoutQuery: PAYMENT_PRIORITY,
+    AnswerShippingQuery: PAYMENT_PRIORITY,
+    AnswerCallbackQuery: CALLBACK_PRIORITY,
+}  # Остальные методы (навигация, проверка подписки) идут с DEFAULT_PRIORITY
+
+UNSCHEDULED_METHODS = (GetUpdates, GetMe, SetWebhook, DeleteWebhook)  # Служебные вызовы идут напрямую
+
+CHAT_LIMITED_PREFIXES = ('Send', 'Copy', 'Forward')  # Новые сообщения в чате: лимит chat_rate
+EDIT_PREFIXES = ('Edit',)  # Редактирование (навигация по меню, прогресс импорта): свой, более щедрый edit_rate
+# Чтение (GetChatMember, GetChat) идёт лишь под глобальным лимитом
+
+
+class ScheduledSession(AiohttpSession):
+    """HTTP сессия бота с очередью запросов: глобальный и per-chat лимиты, приоритеты и учёт retry_after"""
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, edit_rate: float = 5, max_retries: int = 3,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.global_interval = 1 / global_rate
+        self.chat_interval = 1 / chat_rate
+        self.edit_interval = 1 / edit_rate
+        self.max_retries = max_retries
+        self.retries = 0
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._queue: asyncio.PriorityQueue | None = None
+        self._worker: asyncio.Task | None = None
+        self._counter = count()
+        self._paused_until = 0.0
+        self._chat_next: dict[tuple[int | str, str], float] = {}
+        self._recreating = False  # close() вызван из create_session при пересоздании соединения
+
+    def stats(self) -> dict:
+        """Метрики очереди: глубина, ожидание в очереди, повторы после 429"""
+        return {
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'requests': self.requests,
+            'retries': self.retries,
+            'wait_avg_ms': self.wait_total / self.requests * 1000 if self.requests else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+        }
+
+    async def _dispatch(self):
+        """Выпускаем запросы из очереди по приоритету, не чаще global_rate в секунду"""
+        while True:
+            _, _, ready = await self._queue.get()
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not ready.done():
+                ready.set_result(None)
+            await asyncio.sleep(self.global_interval)
+
+    def _chat_limit(self, method: TelegramMethod) -> tuple[tuple[int | str, str], float] | None:
+        """Ключ и интервал лимита на чат: отправка и редактирование сообщений считаются отдельно"""
+        chat_id = getattr(method, 'chat_id', None)
+        name = type(method).__name__
+        if chat_id is None:
+            return None
+        if name.startswith(CHAT_LIMITED_PREFIXES):
+            return (chat_id, 'send'), self.chat_interval
+        if name.startswith(EDIT_PREFIXES):
+            return (chat_id, 'edit'), self.edit_interval
+        return None
+
+    async def _wait_turn(self, priority: int, chat_limit: tuple[tuple[int | str, str], float] | None):
+        """Ждём свободного окна для чата, затем своей очереди по глобальному лимиту"""
+        start = time.monotonic()
+        if len(self._chat_next) > 10_000:  # Забываем чаты, у которых окно уже наступило
+            self._chat_next = {chat: slot for chat, slot in self._chat_next.items() if slot > start}
+        if chat_limit is not None:
+            key, interval = chat_limit
+            slot = max(start, self._chat_next.get(key, 0.0))
+            self._chat_next[key] = slot + interval
+            if slot > start:
+                await asyncio.sleep(slot - start)
+
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.PriorityQueue()
+            self._worker = asyncio.create_task(self._dispatch())
+        ready = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((priority, next(self._counter), ready))
+        await ready
+
+        wait = time.monotonic() - start
+        self.requests += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None):
+        """Выполняем запрос в порядке очереди, повторяя его после 429 через retry_after"""
+        if isinstance(method, UNSCHEDULED_METHODS):
+            return await super().make_request(bot, method, timeout)
+
+        priority = PRIORITIES.get(type(method), DEFAULT_PRIORITY)
+        chat_limit = self._chat_limit(method)
+        for attempt in range(self.max_retries + 1):
+            await self._wait_turn(priority, chat_limit)
+            try:
+                return await super().make_request(bot, method, timeout)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+
+    async def create_session(self):
+        """Создаём HTTP сессию; aiogram при этом может закрыть старую через close() - очередь тогда не трогаем"""
+        self._recreating = True
+        try:
+            return await super().create_session()
+        finally:
+            self._recreating = False
+
+    async def close(self) -> None:
+        if self._worker is not None and not self._recreating:
+            self._worker.cancel()
+            self._worker = None
+        await super().close()
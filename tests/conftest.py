@@ -0,0 +1,52 @@
+import os
+
+os.environ.setdefault('DATABASE_ENGINE', 'sqlite+aiosqlite:///:memory:')  # Модули читают настройки при импорте
+
+import pytest  # noqa: E402
+import pytest_asyncio  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from database.cache import banner_cache, catalog_cache, menu_cache, product_cache  # noqa: E402
+from database.migrations import upgrade  # noqa: E402
+from database.models import Base, Product, SubCategory  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    """Файловая SQLite с полной схемой и начальными данными (каждому тесту - своя)"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.sqlite3'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def session_maker(engine):
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@pytest_asyncio.fixture
+async def session(session_maker):
+    async with session_maker() as session:
+        yield session
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Кэши живут в модулях - сбрасываем их между тестами"""
+    for cache in (banner_cache, catalog_cache, product_cache, menu_cache):
+        cache.invalidate()
+
+
+async def add_products(session, *products: dict) -> list[int]:
+    """Добавляем товары в первую подкатегорию и возвращаем их id"""
+    subcategory_id = (await session.execute(select(SubCategory.id).order_by(SubCategory.id))).scalar()
+    rows = [{'description': f'Товар {number}', 'image': f'file-{number}', 'price': 100, 'subcategory_id': subcategory_id,
+             **product} for number, product in enumerate(products, start=1)]
+    result = await session.execute(insert(Product).returning(Product.id), rows)
+    product_ids = list(result.scalars())
+    await session.commit()
+    return product_ids
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import func, select
+
+from database.catalog import CatalogTree
+from database.models import Product
+from excel.products_io import parse_product_row, read_product_rows
+from filters.chat_types import IsAdmin
+from handlers import admin_private
+
+TREE = CatalogTree([(1, 'ПК', 10, 'Ноутбуки', 0)])
+
+
+async def test_only_listed_users_are_admins(monkeypatch):
+    monkeypatch.setenv('ADMIN_IDS', '7, 42')
+    is_admin = IsAdmin()
+
+    assert await is_admin(SimpleNamespace(from_user=SimpleNamespace(id=42)))
+    assert not await is_admin(SimpleNamespace(from_user=SimpleNamespace(id=1)))
+    assert not await is_admin(SimpleNamespace(from_user=None))
+
+
+async def test_nobody_is_admin_without_admin_ids(monkeypatch):
+    monkeypatch.delenv('ADMIN_IDS', raising=False)
+
+    assert not await IsAdmin()(SimpleNamespace(from_user=SimpleNamespace(id=42)))
+
+
+def test_import_row_is_parsed_in_kopecks():
+    product = parse_product_row(['Ноутбук', '1990,50', 'ПК', '10', 'file-id', '3'], TREE)
+
+    assert product == {'description': 'Ноутбук', 'image': 'file-id', 'price': 199050, 'quantity': 3,
+                       'subcategory_id': 10}
+
+
+@pytest.mark.parametrize('price', ['0', '-1', 'abc', 'NaN'])
+def test_import_rejects_non_positive_price_like_the_admin_form(price):
+    with pytest.raises(ValueError, match='неверная цена'):
+        parse_product_row(['Ноутбук', price, 'ПК', 'Ноутбуки', 'file-id', ''], TREE)
+
+
+async def test_import_closes_file_and_refreshes_catalog_once(session, monkeypatch, tmp_path):
+    calls, opened = [], []
+
+    async def download(document, destination):
+        with open(destination, 'w', encoding='utf-8') as file:
+            file.write('description;price;category;subcategory;image;quantity\n')
+            file.writelines(f'Товар {number};100;ПК;Комплектующие;file-{number};\n'
+                            for number in range(5))
+
+    def rows(file_path):
+        opened.append(read_product_rows(file_path))
+        return opened[-1]
+
+    async def rebuild(session):
+        calls.append('snapshots')
+
+    monkeypatch.setattr(admin_private, 'IMPORT_BATCH_SIZE', 2)
+    monkeypatch.setattr(admin_private, 'read_product_rows', rows)
+    monkeypatch.setattr(admin_private, 'invalidate_catalog', lambda: calls.append('invalidate'))
+    monkeypatch.setattr(admin_private, 'build_menu_snapshots', rebuild)
+    status = SimpleNamespace(edit_text=AsyncMock())
+    message = SimpleNamespace(document=SimpleNamespace(file_name='products.csv'),
+                              answer=AsyncMock(return_value=status))
+
+    await admin_private.import_products(message, SimpleNamespace(clear=AsyncMock()), session,
+                                        SimpleNamespace(download=download))
+
+    assert 'Добавлено товаров: 5, ошибок: 0' in message.answer.await_args.args[0]
+    assert status.edit_text.await_count == 3  # Пачки по 2 строки (первая с заголовком)
+    assert calls == ['invalidate', 'snapshots']
+    assert opened[0].gi_frame is None  # Файл закрыт до удаления
+    assert (await session.execute(select(func.count()).select_from(Product))).scalar() == 5
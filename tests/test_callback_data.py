@@ -0,0 +1,31 @@
+import pytest
+from aiogram.filters.callback_data import CallbackData
+
+from buttons.inline_buttons import MenuCallBack
+
+CALLBACKS = [
+    MenuCallBack(level=0, menu_name='main'),
+    MenuCallBack(level=2, menu_name='category', category=3),
+    MenuCallBack(level=3, menu_name='next', category=17, page=12),
+    MenuCallBack(level=4, menu_name='add_to_cart', product_id=150_000, quantity=7, page=7),
+    MenuCallBack(level=5, menu_name='новое_меню', page=300),  # Имя вне таблицы кодов передаётся строкой
+]
+
+
+@pytest.mark.parametrize('callback', CALLBACKS)
+def test_compact_round_trip(callback):
+    packed = callback.pack()
+
+    assert MenuCallBack.unpack(packed) == callback
+    assert MenuCallBack.unpack(packed) is not MenuCallBack.unpack(packed)  # Кэшируется разбор, а не модель
+
+
+def test_legacy_buttons_still_unpack():
+    assert MenuCallBack.unpack('menu:3:next:17:12::') == MenuCallBack(level=3, menu_name='next', category=17, page=12)
+    assert MenuCallBack.unpack(CallbackData.pack(CALLBACKS[3])) == CALLBACKS[3]
+
+
+@pytest.mark.parametrize('value', ['~', '~AgAA', '~AQ', '~!!!'])
+def test_broken_compact_data_is_rejected(value):
+    with pytest.raises(ValueError):
+        MenuCallBack.unpack(value)
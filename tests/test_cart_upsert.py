@@ -0,0 +1,37 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from database.models import Cart, User
+from database.orm_queries import orm_add_to_cart, orm_add_user
+from tests.conftest import add_products
+
+USER_ID = 1
+CLICKS = 20
+
+
+async def add_to_cart(session_maker, product_id: int, quantity: int):
+    """Одно нажатие "Подтвердить" в своей сессии, как в отдельном апдейте"""
+    async with session_maker() as session:
+        await orm_add_user(session, user_id=USER_ID, first_name='Покупатель')
+        await orm_add_to_cart(session, user_id=USER_ID, product_id=product_id, quantity=quantity)
+
+
+async def test_parallel_add_to_cart_keeps_one_line(session_maker, session):
+    product_id, = await add_products(session, {})
+
+    await asyncio.gather(*(add_to_cart(session_maker, product_id, 2) for _ in range(CLICKS)))
+
+    lines = (await session.execute(select(Cart.product_id, Cart.quantity).where(Cart.user_id == USER_ID))).all()
+    assert lines == [(product_id, 2 * CLICKS)]
+    assert (await session.execute(select(func.count()).select_from(User))).scalar() == 1
+
+
+async def test_parallel_add_of_different_products(session_maker, session):
+    product_ids = await add_products(session, {}, {}, {})
+
+    await asyncio.gather(*(add_to_cart(session_maker, product_id, 1) for product_id in product_ids * 3))
+
+    lines = (await session.execute(select(Cart.product_id, Cart.quantity).where(Cart.user_id == USER_ID)
+                                   .order_by(Cart.product_id))).all()
+    assert lines == [(product_id, 3) for product_id in product_ids]
@@ -0,0 +1,109 @@
+import asyncio
+
+from sqlalchemy import delete, func, select
+
+from database.migrations import upgrade
+from database.models import Cart, OrderItem, Product, SchemaVersion
+from database.orm_queries import (
+    ORDER_STOCK_SHORTAGE, orm_add_to_cart, orm_check_cart, orm_create_order, orm_get_cart_invoice,
+)
+from tests.conftest import add_products
+
+USER_ID = 1
+
+
+async def test_check_cart_sums_lines_and_counts_missing_stock(session):
+    untracked, in_stock, short = await add_products(
+        session, {'price': 1000, 'quantity': None}, {'price': 250, 'quantity': 5}, {'price': 99, 'quantity': 1},
+    )
+    await orm_add_to_cart(session, USER_ID, untracked, 2)
+    await orm_add_to_cart(session, USER_ID, in_stock, 4)
+    await orm_add_to_cart(session, USER_ID, short, 3)
+
+    assert await orm_check_cart(session, USER_ID) == (2 * 1000 + 4 * 250 + 3 * 99, 1)
+
+
+async def test_check_cart_blocks_products_without_price(session):
+    free, = await add_products(session, {'price': 0})
+    await orm_add_to_cart(session, USER_ID, free, 1)
+
+    assert await orm_check_cart(session, USER_ID) == (0, 1)
+
+
+async def test_check_empty_cart(session):
+    assert await orm_check_cart(session, USER_ID) == (0, 0)
+
+
+async def test_cart_invoice_lines_and_total(session):
+    first, second = await add_products(session, {'price': 1000}, {'price': 250})
+    await orm_add_to_cart(session, USER_ID, first, 2)
+    await orm_add_to_cart(session, USER_ID, second, 1)
+
+    lines = await orm_get_cart_invoice(session, USER_ID)
+
+    assert [(line.id, line.quantity, line.amount, line.total) for line in lines] == [
+        (first, 2, 2000, 2250), (second, 1, 250, 2250),
+    ]
+
+
+async def test_create_order_records_prices_and_decrements_tracked_stock(session):
+    untracked, tracked = await add_products(session, {'price': 1000, 'quantity': None}, {'price': 250, 'quantity': 5})
+    await orm_add_to_cart(session, USER_ID, untracked, 2)
+    await orm_add_to_cart(session, USER_ID, tracked, 3)
+
+    order = await orm_create_order(session, USER_ID, {
+        'total_amount': 2750, 'currency': 'RUB', 'telegram_payment_charge_id': 'tg-1', 'provider_payment_charge_id': 'pr-1',
+    })
+
+    items = (await session.execute(select(OrderItem.product_id, OrderItem.quantity, OrderItem.price)
+                                   .where(OrderItem.order_id == order.id).order_by(OrderItem.product_id))).all()
+    assert items == [(untracked, 2, 1000), (tracked, 3, 250)]
+    stock = dict((await session.execute(select(Product.id, Product.quantity))).all())
+    assert (stock[untracked], stock[tracked]) == (None, 2)
+    assert await orm_check_cart(session, USER_ID) == (0, 0)
+
+
+async def test_legacy_zero_stock_becomes_untracked(engine, session):
+    legacy, = await add_products(session, {'quantity': 0})
+    await session.execute(delete(SchemaVersion).where(SchemaVersion.version >= 7))
+    await session.commit()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade)
+
+    assert (await session.execute(select(Product.quantity).where(Product.id == legacy))).scalar() is None
+
+
+async def test_two_buyers_of_the_last_unit(session_maker):
+    async with session_maker() as session:
+        last, = await add_products(session, {'price': 500, 'quantity': 1})
+        for user_id in (1, 2):
+            await orm_add_to_cart(session, user_id, last, 1)
+
+    async def buy(user_id: int):
+        async with session_maker() as session:
+            return await orm_create_order(session, user_id, {
+                'total_amount': 500, 'currency': 'RUB', 'telegram_payment_charge_id': f'tg-{user_id}',
+            })
+
+    orders = await asyncio.gather(buy(1), buy(2))
+
+    assert sorted(order.status for order in orders) == ['paid', ORDER_STOCK_SHORTAGE]
+    async with session_maker() as session:
+        assert (await session.execute(select(Product.quantity).where(Product.id == last))).scalar() == 0
+        assert (await session.execute(select(func.count()).select_from(Cart))).scalar() == 0
+
+
+async def test_shortage_rolls_back_every_line_of_the_order(session):
+    enough, short = await add_products(session, {'quantity': 5}, {'quantity': 1})
+    await orm_add_to_cart(session, USER_ID, enough, 2)
+    await orm_add_to_cart(session, USER_ID, short, 2)
+
+    order = await orm_create_order(session, USER_ID, {
+        'total_amount': 400, 'currency': 'RUB', 'telegram_payment_charge_id': 'tg-1',
+    })
+
+    assert order.status == ORDER_STOCK_SHORTAGE
+    stock = dict((await session.execute(select(Product.id, Product.quantity))).all())
+    assert (stock[enough], stock[short]) == (5, 1)
+    assert (await session.execute(select(func.count()).select_from(OrderItem))).scalar() == 2
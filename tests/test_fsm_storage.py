@@ -0,0 +1,62 @@
+import asyncio
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database.fsm_storage import SQLStorage, get_fsm_storage
+
+
+class AddProduct(StatesGroup):
+    name = State()
+    price = State()
+
+
+def storage_key(user_id: int = 1) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+async def test_state_and_data_round_trip(session_maker):
+    storage = SQLStorage(session_maker)
+    key = storage_key()
+
+    assert await storage.get_state(key) is None
+    assert await storage.get_data(key) == {}
+
+    await storage.set_state(key, AddProduct.name)
+    await storage.set_data(key, {'name': 'Видеокарта', 'images': ['file-1']})
+    await storage.set_state(key, AddProduct.price)
+
+    assert await storage.get_state(key) == AddProduct.price.state
+    assert await storage.get_data(key) == {'name': 'Видеокарта', 'images': ['file-1']}
+    assert await storage.get_state(storage_key(2)) is None  # Записи разных пользователей не пересекаются
+
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+    assert (await storage.get_state(key), await storage.get_data(key)) == (None, {})
+
+
+async def test_data_survives_a_new_storage_instance(session_maker):
+    await SQLStorage(session_maker).set_data(storage_key(), {'step': 2})
+
+    assert await SQLStorage(session_maker).get_data(storage_key()) == {'step': 2}  # Как во втором процессе бота
+
+
+async def test_concurrent_first_writes_to_one_key(session_maker):
+    storages = [SQLStorage(session_maker) for _ in range(2)]  # Два процесса бота
+    key = storage_key()
+
+    await asyncio.gather(*(storage.set_state(key, AddProduct.name) for storage in storages),
+                         *(storage.set_data(key, {'name': 'Кабель'}) for storage in storages))
+
+    assert await storages[0].get_state(key) == AddProduct.name.state
+    assert await storages[1].get_data(key) == {'name': 'Кабель'}
+
+
+def test_storage_backend_is_chosen_by_env(session_maker, monkeypatch):
+    monkeypatch.delenv('FSM_STORAGE', raising=False)
+    assert isinstance(get_fsm_storage(session_maker), MemoryStorage)
+
+    monkeypatch.setenv('FSM_STORAGE', 'sql')
+    storage = get_fsm_storage(session_maker)
+    assert isinstance(storage, SQLStorage) and storage.session_pool is session_maker
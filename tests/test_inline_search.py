@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from buttons.inline_buttons import MenuCallBack
+from handlers.user_private import search_inline, user_menu
+from tests.conftest import add_products
+
+USER_ID = 7
+
+
+async def test_inline_result_has_a_buy_button(session):
+    product_id, = await add_products(session, {'description': 'Видеокарта игровая', 'price': 1999000})
+    inline_query = SimpleNamespace(query='видеокарта', offset='', answer=AsyncMock())
+
+    await search_inline(inline_query, session)
+
+    result, = inline_query.answer.await_args.args[0]
+    button, = result.reply_markup.inline_keyboard[0]
+    assert button.text == 'Купить'
+    assert MenuCallBack.unpack(button.callback_data) == MenuCallBack(level=4, menu_name='precart',
+                                                                      product_id=product_id)
+
+
+def inline_callback(data: str, send_photo: AsyncMock) -> SimpleNamespace:
+    """Нажатие кнопки под inline-сообщением: callback.message у таких колбеков нет"""
+    return SimpleNamespace(data=data, message=None, inline_message_id='inline-1',
+                           from_user=SimpleNamespace(id=USER_ID), bot=SimpleNamespace(send_photo=send_photo),
+                           answer=AsyncMock())
+
+
+async def test_buy_button_opens_product_in_private_chat(session):
+    product_id, = await add_products(session, {'image': 'product-file-id'})
+    callback_data = MenuCallBack(level=4, menu_name='precart', product_id=product_id)
+    callback = inline_callback(callback_data.pack(), AsyncMock())
+
+    await user_menu(callback, callback_data, session)
+
+    chat_id, photo = callback.bot.send_photo.await_args.args
+    assert (chat_id, photo) == (USER_ID, 'product-file-id')
+    markup = callback.bot.send_photo.await_args.kwargs['reply_markup']
+    assert any(MenuCallBack.unpack(button.callback_data).menu_name == 'add_to_cart'
+               for row in markup.inline_keyboard for button in row)
+    callback.answer.assert_awaited_once_with("Товар открыт в чате с ботом")
+
+
+async def test_buy_button_asks_to_start_the_bot_first(session):
+    product_id, = await add_products(session, {})
+    callback_data = MenuCallBack(level=4, menu_name='precart', product_id=product_id)
+    forbidden = TelegramForbiddenError(method=None, message='bot was blocked by the user')
+    callback = inline_callback(callback_data.pack(), AsyncMock(side_effect=forbidden))
+
+    await user_menu(callback, callback_data, session)
+
+    assert callback.answer.await_args.kwargs == {'show_alert': True}
+    assert '/start' in callback.answer.await_args.args[0]
@@ -0,0 +1,21 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database.instrumentation import count_queries, instrument_engine
+
+
+async def test_failed_statement_is_counted_and_leaves_no_state(engine, session):
+    instrument_engine(engine)
+
+    with count_queries() as stats:
+        with pytest.raises(OperationalError):
+            await session.execute(text('SELECT * FROM missing_table'))
+        await session.rollback()
+        await session.execute(text('SELECT 1'))
+
+    assert stats.count == 2
+    assert stats.statements == ['SELECT * FROM missing_table', 'SELECT 1']
+    assert 0 <= stats.duration < 1
+    connection = await session.connection()
+    assert not any(key.startswith('query') for key in (await connection.get_raw_connection()).info)
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import BufferedInputFile
+from sqlalchemy import update
+
+from database.cache import menu_cache
+from database.models import Banner
+from handlers.menu_processing import build_menu_snapshots, get_menu_content
+from telegram_api.media import MediaStorage, media_storage
+
+BOT = SimpleNamespace(id=42)  # Без MEDIA_CHAT_ID бот в prewarm не вызывается
+
+
+async def test_prewarm_fails_when_banners_would_upload_placeholder_bytes(session, tmp_path):
+    storage = MediaStorage(chat_id=None, media_dir=str(tmp_path))
+
+    with pytest.raises(RuntimeError, match='MEDIA_CHAT_ID'):
+        await storage.prewarm(BOT, session)
+
+
+async def test_prewarm_without_media_chat_is_fine_when_banners_have_images(session, tmp_path):
+    await session.execute(update(Banner).values(image='banner-file-id'))
+    await session.commit()
+
+    await MediaStorage(chat_id=None, media_dir=str(tmp_path)).prewarm(BOT, session)
+
+
+async def test_screens_with_placeholder_bytes_are_not_cached(session, monkeypatch):
+    monkeypatch.setattr(media_storage, 'placeholder_id', None)
+
+    await build_menu_snapshots(session)
+    media, _ = await get_menu_content(session, level=0, menu_name='main')
+
+    assert isinstance(media.media, BufferedInputFile)
+    assert menu_cache.stats()['size'] == 0
+
+    monkeypatch.setattr(media_storage, 'placeholder_id', 'placeholder-file-id')
+    media, _ = await get_menu_content(session, level=0, menu_name='main')
+
+    assert media.media == 'placeholder-file-id'
+    assert menu_cache.stats()['size'] == 1
@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import insert, select
+
+from database.instrumentation import count_queries, instrument_engine
+from database.models import Category, Question, SubCategory
+from database.orm_queries import orm_add_to_cart
+from handlers.menu_processing import build_menu_snapshots, get_menu_content
+from telegram_api.media import media_storage
+from tests.conftest import add_products
+
+USER_ID = 1
+
+
+@pytest.fixture
+async def menu(engine, session, monkeypatch):
+    """Каталог с товарами, FAQ и корзина пользователя; заглушка баннеров прогрета, движок считает запросы"""
+    monkeypatch.setattr(media_storage, 'placeholder_id', 'placeholder-file-id')
+    instrument_engine(engine)
+    product_ids = await add_products(session, {}, {}, {})
+    await session.execute(insert(Question), [{'question': f'Вопрос {i}', 'answer': f'Ответ {i}'} for i in range(3)])
+    await session.commit()
+    for product_id in product_ids[:2]:
+        await orm_add_to_cart(session, USER_ID, product_id, 1)
+    return {
+        'category': (await session.execute(select(Category.id).order_by(Category.id))).scalar(),
+        'subcategory': (await session.execute(select(SubCategory.id).order_by(SubCategory.id))).scalar(),
+        'product_id': product_ids[0],
+    }
+
+
+def screens(menu: dict) -> dict[str, dict]:
+    """Параметры get_menu_content для каждого уровня меню"""
+    return {
+        'main': {'level': 0, 'menu_name': 'main'},
+        'catalog': {'level': 1, 'menu_name': 'catalog', 'page': 1},
+        'subcatalog': {'level': 2, 'menu_name': 'category', 'category': menu['category'], 'page': 1},
+        'products': {'level': 3, 'menu_name': 'next', 'category': menu['subcategory'], 'page': 2},
+        'precart': {'level': 4, 'menu_name': 'precart', 'page': 1, 'product_id': menu['product_id']},
+        'cart': {'level': 5, 'menu_name': 'next', 'page': 2, 'user_id': USER_ID},
+        'cart_delete': {'level': 5, 'menu_name': 'delete', 'page': 2, 'user_id': USER_ID,
+                        'product_id': menu['product_id']},
+        'faq': {'level': 6, 'menu_name': 'next', 'page': 2},
+    }
+
+
+async def queries(session, screen: dict) -> int:
+    with count_queries() as stats:
+        await get_menu_content(session, **screen)
+    return stats.count
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('main', 1),  # баннер
+    ('catalog', 2),  # баннер, дерево каталога
+    ('subcatalog', 2),  # баннер, дерево каталога
+    ('products', 2),  # COUNT и страница товаров
+    ('precart', 1),  # карточка товара
+    ('cart', 3),  # баннер, COUNT и страница корзины
+    ('cart_delete', 4),  # DELETE строки, баннер, COUNT и страница корзины
+    ('faq', 3),  # баннер, COUNT и страница вопросов
+])
+async def test_cold_screen_query_count(session, menu, name, expected):
+    assert await queries(session, screens(menu)[name]) == expected
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('main', 0),  # снимок
+    ('catalog', 0),
+    ('subcatalog', 0),
+    ('faq', 0),
+    ('products', 2),  # страницы товаров не кэшируются
+    ('precart', 0),  # карточка товара из кэша
+    ('cart', 2),  # баннер из кэша, данные пользователя - нет
+])
+async def test_warm_screen_query_count(session, menu, name, expected):
+    await build_menu_snapshots(session)
+    await get_menu_content(session, **screens(menu)[name])
+
+    assert await queries(session, screens(menu)[name]) == expected
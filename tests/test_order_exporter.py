@@ -0,0 +1,50 @@
+import asyncio
+
+from openpyxl import load_workbook
+
+from excel import excel_functional
+from excel.excel_functional import OrderExporter
+
+
+async def test_failed_batch_is_logged_and_retried(tmp_path, monkeypatch, caplog):
+    append_rows = excel_functional.append_rows_to_excel
+    attempts = []
+
+    def flaky_append(file_path, sheet_name, rows):
+        attempts.append(list(rows))
+        if len(attempts) == 1:
+            raise PermissionError('file is locked')
+        append_rows(file_path, sheet_name, rows)
+
+    monkeypatch.setattr(excel_functional, 'append_rows_to_excel', flaky_append)
+    exporter = OrderExporter(str(tmp_path / 'orders.xlsx'), 'Orders', flush_interval=0.01, retry_interval=0.05)
+    await exporter.start()
+
+    exporter.put([1, 'first'])
+    await asyncio.sleep(0.2)
+    exporter.put([2, 'second'])
+    await exporter.stop()
+
+    assert 'Order export failed, 1 rows will be retried' in caplog.text
+    assert attempts[0] == [[1, 'first']] and attempts[1] == [[1, 'first']]
+    sheet = load_workbook(tmp_path / 'orders.xlsx')['Orders']
+    assert [list(row) for row in sheet.iter_rows(values_only=True)] == [[1, 'first'], [2, 'second']]
+    assert exporter.stats() == {'queued': 0, 'failed_rows': 0, 'failures': 1}
+
+
+async def test_rows_are_kept_while_disk_keeps_failing(tmp_path, monkeypatch, caplog):
+    def broken_append(file_path, sheet_name, rows):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(excel_functional, 'append_rows_to_excel', broken_append)
+    exporter = OrderExporter(str(tmp_path / 'orders.xlsx'), 'Orders', flush_interval=0.01, retry_interval=0.05)
+    await exporter.start()
+
+    exporter.put([1, 'first'])
+    exporter.put([2, 'second'])
+    await asyncio.sleep(0.2)
+    assert not exporter._task.done()
+    await exporter.stop()
+
+    assert exporter.stats()['failed_rows'] == 2
+    assert "Order export stopped with 2 unsaved rows: [[1, 'first'], [2, 'second']]" in caplog.text
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from buttons.inline_buttons import MenuCallBack
+from handlers import user_private
+
+
+class FakeCallback(SimpleNamespace):
+    """Нажатие кнопки в сообщении 1 чата 1"""
+
+    def __init__(self):
+        super().__init__(message=SimpleNamespace(chat=SimpleNamespace(id=1), message_id=1))
+
+    async def answer(self, text: str | None = None, **kwargs):
+        pass
+
+
+def increment(page: int) -> MenuCallBack:
+    return MenuCallBack(level=4, menu_name='increment', product_id=1, page=page)
+
+
+async def test_click_during_slow_edit_builds_on_pending_quantity(monkeypatch):
+    shown = []
+
+    async def get_menu_content(session, **kwargs):
+        return None, kwargs['page']
+
+    async def slow_edit(callback, media, quantity):
+        await asyncio.sleep(0.1)  # Telegram долго отвечает на первое редактирование
+        shown.append(quantity)
+
+    monkeypatch.setattr(user_private, 'PRECART_DEBOUNCE', 0.01)
+    monkeypatch.setattr(user_private, 'get_menu_content', get_menu_content)
+    monkeypatch.setattr(user_private, 'edit_menu_message', slow_edit)
+
+    first = asyncio.create_task(user_private.change_precart_quantity(FakeCallback(), increment(1), None))
+    await asyncio.sleep(0.05)  # Первое редактирование (2) ещё не завершено, на кнопках всё ещё page=1
+    await user_private.change_precart_quantity(FakeCallback(), increment(1), None)
+    await first
+
+    assert shown == [2, 3]
+    assert user_private.pending_quantities == {}
+
+
+async def test_back_to_shown_quantity_skips_edit(monkeypatch):
+    edits = []
+
+    async def edit(callback, media, reply_markup):
+        edits.append(reply_markup)
+
+    monkeypatch.setattr(user_private, 'PRECART_DEBOUNCE', 0.01)
+    monkeypatch.setattr(user_private, 'edit_menu_message', edit)
+
+    await asyncio.gather(
+        user_private.change_precart_quantity(FakeCallback(), increment(3), None),
+        user_private.change_precart_quantity(FakeCallback(), MenuCallBack(level=4, menu_name='decrement',
+                                                                          product_id=1, page=3), None),
+    )
+
+    assert edits == []
+    assert user_private.pending_quantities == {}
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import event, insert, select
+
+from database.models import Cart, SubCategory
+from database.orm_queries import (
+    orm_delete_from_cart,
+    orm_get_catalog_tree,
+    orm_get_products_page,
+    orm_get_user_carts_page,
+)
+from tests.conftest import add_products
+
+USER_ID = 1
+
+
+async def query_plans(engine, call) -> list[str]:
+    """Выполняем вызов, перехватывая его SQL, и возвращаем EXPLAIN QUERY PLAN каждого запроса"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    try:
+        await call()
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+    plans = []
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = await conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            plans.append(' | '.join(row[-1] for row in rows))
+    return plans
+
+
+@pytest.fixture
+async def seeded(engine, session):
+    """Несколько сотен товаров в разных подкатегориях и корзины нескольких пользователей"""
+    subcategory_ids = list((await session.execute(select(SubCategory.id))).scalars())
+    product_ids = await add_products(session, *({'subcategory_id': subcategory_ids[number % len(subcategory_ids)]}
+                                                for number in range(300)))
+    await session.execute(insert(Cart), [{'user_id': user_id, 'product_id': product_id, 'quantity': 1}
+                                         for user_id in range(1, 21) for product_id in product_ids[user_id::25]])
+    await session.commit()
+    return subcategory_ids, product_ids
+
+
+async def test_products_page_uses_subcategory_index(engine, session, seeded):
+    subcategory_ids, _ = seeded
+    plans = await query_plans(engine, lambda: orm_get_products_page(session, subcategory_ids[0], page=3))
+
+    assert len(plans) == 2  # COUNT и сама страница
+    assert all('ix_product_subcategory_id_id' in plan and 'SCAN product' not in plan for plan in plans), plans
+
+
+async def test_cart_page_uses_user_index(engine, session, seeded):
+    plans = await query_plans(engine, lambda: orm_get_user_carts_page(session, USER_ID, page=2))
+
+    assert len(plans) == 2
+    assert all('SEARCH cart USING' in plan and 'ix_cart_user_id' in plan and 'SCAN cart' not in plan
+               for plan in plans), plans
+
+
+async def test_cart_line_lookup_uses_unique_index(engine, session, seeded):
+    _, product_ids = seeded
+    plans = await query_plans(engine, lambda: orm_delete_from_cart(session, USER_ID, product_ids[1]))
+
+    assert any('ix_cart_user_id_product_id' in plan for plan in plans), plans
+
+
+async def test_catalog_tree_joins_through_indexes(engine, session, seeded):
+    plans = await query_plans(engine, lambda: orm_get_catalog_tree(session))
+
+    plan, = plans
+    assert 'ix_subcategory_category_id' in plan, plan
+    assert 'ix_product_subcategory_id_id' in plan and 'SCAN product' not in plan, plan
@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import pytest_asyncio
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from telegram_api.scheduled_session import ScheduledSession
+
+TOKEN = '42:TEST'
+
+
+class FakeTelegram:
+    """Локальный сервер Bot API: записывает вызовы и по запросу отвечает 429"""
+
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = []
+        self.too_many_requests = 0  # Сколько следующих запросов отклонить с retry_after
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        data = dict(await request.post())
+        self.calls.append((method, data))
+        if self.too_many_requests:
+            self.too_many_requests -= 1
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                      'parameters': {'retry_after': 1}}, status=429)
+        return web.json_response({'ok': True, 'result': self.result(method, data)})
+
+    @staticmethod
+    def result(method: str, data: dict):
+        if method == 'sendMessage':
+            return {'message_id': 1, 'date': 0, 'chat': {'id': int(data['chat_id']), 'type': 'private'},
+                    'text': data['text']}
+        if method == 'getChatMember':
+            return {'status': 'member', 'user': {'id': int(data['user_id']), 'is_bot': False, 'first_name': 'u'}}
+        return True
+
+
+@pytest_asyncio.fixture
+async def telegram():
+    fake = FakeTelegram()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    fake.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    yield fake
+    await runner.cleanup()
+
+
+def make_bot(telegram: FakeTelegram, **limits) -> Bot:
+    session = ScheduledSession(api=TelegramAPIServer.from_base(telegram.url), **limits)
+    return Bot(TOKEN, session=session)
+
+
+async def test_messages_to_one_chat_follow_chat_rate(telegram):
+    bot = make_bot(telegram, global_rate=100, chat_rate=4)
+    start = time.monotonic()
+    await asyncio.gather(*(bot.send_message(1, f'message {number}') for number in range(3)))
+    elapsed = time.monotonic() - start
+    await bot.session.close()
+
+    assert elapsed >= 0.45  # Второе и третье сообщение ждут по 1/4 секунды
+    assert [data['text'] for _, data in telegram.calls] == ['message 0', 'message 1', 'message 2']
+
+
+async def test_membership_checks_are_not_limited_per_chat(telegram):
+    bot = make_bot(telegram, global_rate=100, chat_rate=1)
+    start = time.monotonic()
+    await asyncio.gather(*(bot.get_chat_member(-100, user_id) for user_id in range(5)))
+    elapsed = time.monotonic() - start
+    await bot.session.close()
+
+    assert elapsed < 0.5
+    assert len(telegram.calls) == 5
+
+
+async def test_retry_after_is_honored(telegram):
+    bot = make_bot(telegram, global_rate=100, chat_rate=100)
+    telegram.too_many_requests = 1
+    start = time.monotonic()
+    message = await bot.send_message(1, 'hello')
+    elapsed = time.monotonic() - start
+    stats = bot.session.stats()
+    await bot.session.close()
+
+    assert message.text == 'hello'
+    assert elapsed >= 1
+    assert stats['retries'] == 1
+    assert len(telegram.calls) == 2
+
+
+async def test_callback_answers_jump_the_queue(telegram):
+    bot = make_bot(telegram, global_rate=20, chat_rate=100)
+    await asyncio.gather(
+        *(bot.send_message(chat_id, 'navigation') for chat_id in range(1, 5)),
+        bot.answer_callback_query('callback'),
+    )
+    await bot.session.close()
+
+    assert telegram.calls[0][0] == 'answerCallbackQuery'
+
+
+async def test_edits_have_their_own_chat_rate(telegram):
+    bot = make_bot(telegram, global_rate=100, chat_rate=1, edit_rate=20)
+    start = time.monotonic()
+    await asyncio.gather(bot.send_message(1, 'menu'),
+                         *(bot.edit_message_text(f'page {number}', chat_id=1, message_id=1) for number in range(3)))
+    elapsed = time.monotonic() - start
+    await bot.session.close()
+
+    assert elapsed < 0.5  # Навигация не ждёт секундного лимита на новые сообщения
+    assert [method for method, _ in telegram.calls].count('editMessageText') == 3
+
+
+async def test_edits_in_one_chat_follow_edit_rate(telegram):
+    bot = make_bot(telegram, global_rate=100, chat_rate=100, edit_rate=4)
+    start = time.monotonic()
+    await asyncio.gather(*(bot.edit_message_text(f'page {number}', chat_id=1, message_id=1) for number in range(3)))
+    elapsed = time.monotonic() - start
+    await bot.session.close()
+
+    assert elapsed >= 0.45
+
+
+async def test_close_stops_the_queue_worker(telegram):
+    bot = make_bot(telegram, global_rate=100, chat_rate=100)
+    await bot.send_message(1, 'hello')  # Первый запрос создаёт HTTP сессию, worker при этом не останавливается
+    worker = bot.session._worker
+    assert worker is not None and not worker.done()
+
+    await bot.session.close()
+    await asyncio.sleep(0)
+
+    assert bot.session._worker is None and worker.cancelled()
@@ -0,0 +1,41 @@
+import threading
+
+from database import orm_queries
+from database.cache import invalidate_catalog
+from database.orm_queries import orm_search_products
+from database.search import InvertedIndex
+from tests.conftest import add_products
+
+
+async def test_index_is_built_off_loop_and_only_after_invalidation(session, monkeypatch):
+    await add_products(session, {'description': 'Видеокарта игровая'}, {'description': 'Кабель питания'})
+    builds = []
+
+    def build(rows):
+        builds.append(threading.current_thread() is threading.main_thread())
+        return InvertedIndex(rows)
+
+    monkeypatch.setattr(orm_queries, 'InvertedIndex', build)
+    monkeypatch.setattr('database.cache.time.monotonic', lambda: 10.0 ** 9)  # TTL кэша давно истёк
+
+    assert [product.description for product in await orm_search_products(session, 'видео')] == ['Видеокарта игровая']
+    assert [product.description for product in await orm_search_products(session, 'кабель')] == ['Кабель питания']
+    assert builds == [False]
+
+    await add_products(session, {'description': 'Кабель HDMI'})
+    invalidate_catalog()
+    assert len(await orm_search_products(session, 'кабель')) == 2
+    assert builds == [False, False]
+
+
+async def test_index_built_before_invalidation_is_not_cached(session, monkeypatch):
+    await add_products(session, {'description': 'Кабель питания'})
+
+    def build_and_invalidate(rows):
+        invalidate_catalog()  # Администратор изменил каталог, пока строился индекс
+        return InvertedIndex(rows)
+
+    monkeypatch.setattr(orm_queries, 'InvertedIndex', build_and_invalidate)
+    await orm_search_products(session, 'кабель')
+
+    assert orm_queries.catalog_cache.get('search_index') is None
@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+
+from buttons.inline_buttons import MenuCallBack
+from handlers.user_private import is_navigation_click
+from middleware.throttling_middlewares import CallbackThrottling, MemoryTokenBucket
+
+
+class FakeCallback(SimpleNamespace):
+    """Колбек пользователя 1 в сообщении message_id; запоминает ответы"""
+
+    def __init__(self, data: str, message_id: int = 1):
+        super().__init__(data=data, from_user=SimpleNamespace(id=1),
+                         message=SimpleNamespace(chat=SimpleNamespace(id=1), message_id=message_id), answers=[])
+
+    async def answer(self, text: str | None = None, **kwargs):
+        self.answers.append(text)
+
+
+def recording_handler(handled: list, delay: float = 0.0):
+    async def handler(event, data):
+        await asyncio.sleep(delay)
+        handled.append(event.data)
+    return handler
+
+
+async def test_bucket_allows_burst_then_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('middleware.throttling_middlewares.time.monotonic', lambda: now[0])
+    bucket = MemoryTokenBucket(rate=2, burst=3)
+
+    assert [await bucket.consume(1) for _ in range(4)] == [True, True, True, False]
+    assert await bucket.consume(2)  # Другой пользователь не затронут
+    now[0] += 0.5
+    assert [await bucket.consume(1) for _ in range(2)] == [True, False]
+
+
+async def test_burst_over_limit_is_answered_without_handler():
+    handled = []
+    throttling = CallbackThrottling(MemoryTokenBucket(rate=0.001, burst=2))
+    callbacks = [FakeCallback(f'page_{number}', message_id=number) for number in range(5)]
+
+    for callback in callbacks:
+        await throttling(recording_handler(handled), callback, {})
+
+    assert handled == ['page_0', 'page_1']
+    assert [callback.answers for callback in callbacks[2:]] == [['Слишком часто, подождите секунду']] * 3
+    assert throttling.stats() == {'throttled': 3, 'superseded': 0}
+
+
+async def test_burst_on_one_message_runs_first_and_latest_only():
+    handled = []
+    throttling = CallbackThrottling(MemoryTokenBucket(rate=100, burst=100))
+    callbacks = [FakeCallback(f'page_{number}') for number in range(10)]
+
+    await asyncio.gather(*(throttling(recording_handler(handled, delay=0.01), callback, {})
+                           for callback in callbacks))
+
+    assert handled == ['page_0', 'page_9']
+    assert throttling.stats()['superseded'] == 8
+    assert all(callback.answers == [None] for callback in callbacks[1:9])
+    assert throttling._locks == {} and throttling._latest == {}
+
+
+async def test_quantity_clicks_use_their_own_limit_and_are_never_superseded():
+    handled = []
+    throttling = CallbackThrottling(
+        MemoryTokenBucket(rate=3, burst=5),
+        keep_all=lambda callback: callback.data == 'increment',
+        keep_all_bucket=MemoryTokenBucket(rate=20, burst=30),
+    )
+    callbacks = [FakeCallback('increment') for _ in range(12)]
+
+    await asyncio.gather(*(throttling(recording_handler(handled), callback, {}) for callback in callbacks))
+
+    assert handled == ['increment'] * 12
+    assert throttling.stats() == {'throttled': 0, 'superseded': 0}
+    assert await throttling.bucket.consume(1)  # Общий лимит нажатия +1 не расходуют
+
+
+async def test_cart_write_in_burst_is_not_superseded_by_navigation():
+    handled = []
+    throttling = CallbackThrottling(MemoryTokenBucket(rate=100, burst=100), supersede=is_navigation_click)
+    presses = [
+        MenuCallBack(level=4, menu_name='precart', product_id=1).pack(),
+        MenuCallBack(level=4, menu_name='add_to_cart', product_id=1, quantity=2).pack(),  # "В корзину"
+        MenuCallBack(level=3, menu_name='next', category=1, page=2).pack(),
+        MenuCallBack(level=0, menu_name='main').pack(),  # "Назад"
+    ]
+
+    await asyncio.gather(*(throttling(recording_handler(handled, delay=0.01), FakeCallback(data), {})
+                           for data in presses))
+
+    assert handled == [presses[0], presses[1], presses[3]]
+    assert throttling.stats()['superseded'] == 1
+    assert throttling._locks == {} and throttling._latest == {}
+
+
+async def test_cart_deletes_in_burst_all_run():
+    handled = []
+    throttling = CallbackThrottling(MemoryTokenBucket(rate=100, burst=100), supersede=is_navigation_click)
+    presses = [MenuCallBack(level=5, menu_name='delete', product_id=product_id, page=1).pack()
+               for product_id in range(1, 4)]
+
+    await asyncio.gather(*(throttling(recording_handler(handled, delay=0.01), FakeCallback(data), {})
+                           for data in presses))
+
+    assert handled == presses
+    assert throttling.stats()['superseded'] == 0